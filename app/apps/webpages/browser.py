@@ -0,0 +1,240 @@
+import asyncio
+import dataclasses
+import functools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from selenium import webdriver
+from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+from server.config import Settings
+
+
+@functools.lru_cache
+def load_script(js_filename: str) -> str:
+    with open(Path(__file__).parent / "js" / js_filename, "r") as js_file:
+        return js_file.read()
+
+
+def wait_until_ready(driver: webdriver.Remote, max_wait: float | None = None) -> dict:
+    """Wait until the page is complete and quiet, at most `max_wait` seconds.
+
+    Returns the timings reported by `readiness.js`; `ready` is False when the
+    cap was reached before the page settled.
+    """
+    max_wait = Settings.selenium_loading_time if max_wait is None else max_wait
+    driver.set_script_timeout(max_wait + 5)
+    try:
+        return driver.execute_async_script(
+            load_script("readiness.js"),
+            Settings.selenium_quiet_period_ms,
+            int(max_wait * 1000),
+        )
+    except Exception as e:
+        logging.warning(f"Readiness check failed: {type(e)} {e}")
+        return {"ready": False}
+
+
+@dataclasses.dataclass
+class BrowserSession:
+    driver: webdriver.Remote
+    uses: int = 0
+    last_used: float = dataclasses.field(default_factory=time.monotonic)
+    # the window outside the per-page user contexts
+    home: str | None = None
+    user_context: str | None = None
+
+
+class BrowserPool:
+    """Bounded pool of long-lived remote browser sessions.
+
+    Fetches run on the pool's own executor, which has one thread per session,
+    so at most `size` sessions exist at a time. Each page is opened in its own
+    user context, whose cookies and storage of every origin are dropped with
+    it. Sessions are reset in the background after a page and recycled after
+    `max_uses` fetches, after an error or when they sat idle longer than
+    `idle_timeout`.
+    """
+
+    def __init__(self, size: int, max_uses: int, idle_timeout: int):
+        self.size = size
+        self.max_uses = max_uses
+        self.idle_timeout = idle_timeout
+        self.idle: queue.LifoQueue[BrowserSession] = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.closed = False
+        self.isolated = True
+        self._executor: ThreadPoolExecutor | None = None
+        self._resetter: ThreadPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self._executor is None:
+                self.closed = False
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.size, thread_name_prefix="browser"
+                )
+                self._resetter = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="browser-reset"
+                )
+            return self._executor
+
+    async def run(self, func, *args):
+        """Run a blocking browser function on the pool's executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def create_driver(self) -> webdriver.Remote:
+        webdriver_options = webdriver.FirefoxOptions()
+        webdriver_options.add_argument("--no-shm")
+        # user contexts are only reachable over WebDriver BiDi
+        webdriver_options.enable_bidi = True
+
+        driver = webdriver.Remote(
+            f"{Settings.selenium_remote_url}/wd/hub",
+            DesiredCapabilities.FIREFOX,
+            options=webdriver_options,
+        )
+        driver.set_page_load_timeout(Settings.browser_timeout)
+        # readiness is detected explicitly, lookups must not block
+        driver.implicitly_wait(0)
+        driver.set_window_size(1920, 1200)
+        return driver
+
+    def create_session(self) -> BrowserSession:
+        try:
+            driver = self.create_driver()
+        except Exception:
+            self.slots.release()
+            raise
+        return BrowserSession(driver, home=driver.current_window_handle)
+
+    def quit(self, session: BrowserSession):
+        try:
+            session.driver.quit()
+        except Exception:
+            pass
+        finally:
+            self.slots.release()
+
+    def checkout(self) -> BrowserSession:
+        while True:
+            try:
+                session = self.idle.get_nowait()
+            except queue.Empty:
+                if self.slots.acquire(blocking=False):
+                    session = self.create_session()
+                else:
+                    # every session is busy or being reset
+                    try:
+                        session = self.idle.get(timeout=1)
+                    except queue.Empty:
+                        continue
+            if time.monotonic() - session.last_used > self.idle_timeout:
+                self.quit(session)
+                continue
+            try:
+                self.isolate(session)
+            except Exception as e:
+                logging.warning(f"Discarding browser session that failed to open: {e}")
+                self.quit(session)
+                continue
+            return session
+
+    def isolate(self, session: BrowserSession):
+        """Switch the session to a new tab in a user context of its own."""
+        if not self.isolated:
+            return
+        driver = session.driver
+        try:
+            session.user_context = driver.browser.create_user_context()
+        except Exception as e:
+            logging.warning(f"Browser user contexts are not available: {e}")
+            self.isolated = False
+            return
+        context = driver.browsing_context.create(
+            type="tab", user_context=session.user_context
+        )
+        driver.switch_to.window(context)
+
+    def reset(self, session: BrowserSession):
+        driver = session.driver
+        if session.user_context is not None:
+            # removing the user context closes its tabs and drops their data
+            driver.switch_to.window(session.home)
+            driver.browser.remove_user_context(session.user_context)
+            session.user_context = None
+            return
+        # without user contexts only the current origin can be cleared
+        driver.delete_all_cookies()
+        driver.execute_script(
+            "try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}"
+        )
+        driver.get("about:blank")
+
+    def release(self, session: BrowserSession):
+        try:
+            self.reset(session)
+        except Exception as e:
+            logging.warning(f"Discarding browser session that failed to reset: {e}")
+            self.quit(session)
+            return
+        if self.closed:
+            self.quit(session)
+            return
+        self.idle.put(session)
+
+    def checkin(self, session: BrowserSession, broken: bool = False):
+        session.uses += 1
+        session.last_used = time.monotonic()
+        if broken or self.closed or session.uses >= self.max_uses:
+            self.quit(session)
+            return
+        # the fetch returns without waiting for the reset
+        try:
+            self._resetter.submit(self.release, session)
+        except (AttributeError, RuntimeError):
+            # the pool was closed meanwhile
+            self.quit(session)
+
+    @contextmanager
+    def session(self):
+        session = self.checkout()
+        broken = False
+        try:
+            yield session.driver
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.checkin(session, broken)
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            if self._resetter is not None:
+                # resets still queued quit their sessions once they run
+                self._resetter.shutdown(wait=True)
+                self._resetter = None
+        while True:
+            try:
+                self.quit(self.idle.get_nowait())
+            except queue.Empty:
+                break
+        with self.lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+browser_pool = BrowserPool(
+    Settings.browser_pool_size,
+    Settings.browser_max_uses,
+    Settings.browser_idle_timeout,
+)
@@ -0,0 +1,148 @@
+import dataclasses
+import hashlib
+import html
+import json
+import re
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from fastapi_mongo_base.utils import texttools
+
+from .image_candidates import IMG_URL_ATTRIBUTES, META_IMAGE_NAMES
+
+
+# every attribute image candidates are read from, so a change to any of them
+# changes the normalized hash and the images are extracted again
+IMG_SOURCE_ATTRIBUTES = ("srcset", *IMG_URL_ATTRIBUTES)
+
+# timestamps, counters and similar volatile numbers in the visible text
+number_pattern = re.compile(r"\d+")
+
+
+def content_hash(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8", errors="replace")).hexdigest()
+
+
+def normalized_hash(text: str, image_sources: list[str]) -> str:
+    """Hash of what downstream stages read, ignoring numbers in the text.
+
+    Pages re-rendered with a new timestamp, nonce or token in their markup
+    keep the same normalized hash as long as their text and images match.
+    """
+    normalized = number_pattern.sub("0", text)
+    return content_hash("\n".join([normalized, *image_sources]))
+
+
+@dataclasses.dataclass
+class ParsedDocument:
+    """Parsed page source with the fields derived from it."""
+
+    source_hash: str
+    soup: BeautifulSoup | None
+    text: str = ""
+    title: str | None = None
+    meta_text: str = ""
+    normalized_hash: str | None = None
+    image_candidates: list[str] | None = None
+    # the options `image_candidates` were ranked with
+    image_options: dict | None = None
+
+    def is_enough_text(self, min_length: int = 500) -> bool:
+        return len(self.text) > min_length
+
+
+def parse_document(source: str, parser: str = "html.parser") -> ParsedDocument:
+    """Parse `source` once and derive text, title and meta in a single walk."""
+    soup = BeautifulSoup(source, parser)
+
+    texts: list[str] = []
+    metas: list[str] = []
+    image_sources: list[str] = []
+    title = None
+    for element in soup.descendants:
+        if isinstance(element, Tag):
+            if element.name == "img":
+                image_sources.extend(
+                    element.get(name) for name in IMG_SOURCE_ATTRIBUTES if element.get(name)
+                )
+            elif element.name == "meta":
+                content = element.get("content")
+                if content:
+                    metas.append(content)
+                    name = element.get("property") or element.get("name")
+                    if name in META_IMAGE_NAMES:
+                        image_sources.append(content)
+            elif element.name == "title" and title is None:
+                title = element.get_text().strip()
+        elif type(element) in (NavigableString, CData):
+            texts.append(element)
+
+    text = texttools.remove_whitespace(" ".join(texts).strip())
+    return ParsedDocument(
+        source_hash=content_hash(source),
+        soup=soup,
+        text=text,
+        title=title,
+        meta_text="\n".join(metas),
+        normalized_hash=normalized_hash(text, image_sources),
+    )
+
+
+EMBEDDED_META = ("og:title", "og:description", "twitter:description", "description")
+
+
+def is_prose(value: str, min_length: int = 20) -> bool:
+    value = value.strip()
+    return (
+        len(value) >= min_length
+        and " " in value
+        and not value.startswith(("http://", "https://", "/", "{", "<"))
+    )
+
+
+def json_strings(data) -> list[str]:
+    """Prose-like string values of a decoded JSON payload, depth first."""
+    if isinstance(data, str):
+        return [data.strip()] if is_prose(data) else []
+    if isinstance(data, dict):
+        data = list(data.values())
+    if isinstance(data, list):
+        return [text for item in data for text in json_strings(item)]
+    return []
+
+
+def embedded_texts(soup: BeautifulSoup) -> list[str]:
+    """Text server-rendered pages embed outside the visible markup.
+
+    Reads JSON-LD, Next.js `__NEXT_DATA__`, `<noscript>` blocks and Open
+    Graph / description meta tags.
+    """
+    texts: list[str] = []
+    for script in soup.find_all("script"):
+        if script.get("type") != "application/ld+json" and (
+            script.get("id") != "__NEXT_DATA__"
+        ):
+            continue
+        try:
+            texts.extend(json_strings(json.loads(script.string or "")))
+        except ValueError:
+            continue
+    for noscript in soup.find_all("noscript"):
+        text = BeautifulSoup(noscript.decode_contents(), "html.parser").get_text(
+            " ", strip=True
+        )
+        if is_prose(text):
+            texts.append(text)
+    for meta in soup.find_all("meta"):
+        name = meta.get("property") or meta.get("name")
+        if name in EMBEDDED_META and is_prose(meta.get("content") or ""):
+            texts.append(meta["content"].strip())
+    return list(dict.fromkeys(texts))
+
+
+def with_embedded_content(source: str) -> str:
+    """Append the embedded payload text to `source` as visible paragraphs."""
+    texts = embedded_texts(BeautifulSoup(source, "html.parser"))
+    if not texts:
+        return source
+    paragraphs = "".join(f"<p>{html.escape(text)}</p>" for text in texts)
+    return f'{source}\n<div data-embedded="true">{paragraphs}</div>'
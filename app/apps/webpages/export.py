@@ -0,0 +1,117 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import AsyncIterator
+
+from server.config import Settings
+
+from .models import Webpage
+
+EXPORT_PROJECTION = {
+    "_id": 0,
+    "uid": 1,
+    "url": 1,
+    "title": 1,
+    "images": 1,
+    "languages": 1,
+    "task_status": 1,
+    "crawl_method": 1,
+    "updated_at": 1,
+}
+
+
+def export_query(
+    user_id=None,
+    *,
+    status: str | None = None,
+    domain: str | None = None,
+    updated_at_from: datetime | None = None,
+    updated_at_to: datetime | None = None,
+) -> dict:
+    conditions = Webpage.get_queryset(
+        user_id=user_id,
+        task_status=status,
+        main_domain=domain,
+        updated_at_from=updated_at_from,
+        updated_at_to=updated_at_to,
+    )
+    return {"$and": conditions}
+
+
+def export_record(document: dict, text: str | None) -> dict:
+    languages = document.get("languages") or {}
+    updated_at = document.get("updated_at")
+    return {
+        "uid": document.get("uid"),
+        "url": document.get("url"),
+        "title": document.get("title"),
+        "text": text,
+        "images": document.get("images"),
+        "language": max(languages, key=languages.get) if languages else None,
+        "languages": languages or None,
+        "status": document.get("task_status"),
+        "crawl_method": document.get("crawl_method"),
+        "updated_at": updated_at.isoformat() if updated_at else None,
+    }
+
+
+async def export_batch(documents: list[dict], with_text: bool = True) -> list[dict]:
+    """Records of `documents`, with sources read in one round trip per tier."""
+    from .extraction import extraction_engine
+    from .storage import source_store
+
+    texts: list[str | None] = [None] * len(documents)
+    if with_text:
+        sources = await source_store.get_many([doc["url"] for doc in documents])
+        indexes = [i for i, source in enumerate(sources) if source is not None]
+        extracted = await asyncio.gather(
+            *[extraction_engine.text(sources[i]) for i in indexes]
+        )
+        for i, text in zip(indexes, extracted):
+            texts[i] = text
+    return [export_record(doc, text) for doc, text in zip(documents, texts)]
+
+
+async def export_records(
+    query: dict, *, with_text: bool = True, batch_size: int | None = None
+) -> AsyncIterator[dict]:
+    """Stream the records of the webpages matching `query`.
+
+    At most `batch_size` documents and their sources are held at a time; the
+    next batch is read from the cursor while the current one is extracted.
+    """
+    batch_size = batch_size or Settings.export_batch_size
+    cursor = (
+        Webpage.get_motor_collection()
+        .find(query, EXPORT_PROJECTION, batch_size=batch_size)
+        .sort("_id", 1)
+    )
+
+    pending: asyncio.Task | None = None
+    batch = []
+    try:
+        async for document in cursor:
+            batch.append(document)
+            if len(batch) < batch_size:
+                continue
+            if pending is not None:
+                for record in await pending:
+                    yield record
+            pending = asyncio.create_task(export_batch(batch, with_text))
+            batch = []
+        if pending is not None:
+            for record in await pending:
+                yield record
+            pending = None
+        if batch:
+            for record in await export_batch(batch, with_text):
+                yield record
+    finally:
+        if pending is not None:
+            pending.cancel()
+        await cursor.close()
+
+
+async def ndjson_lines(records: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for record in records:
+        yield json.dumps(record, ensure_ascii=False, default=str) + "\n"
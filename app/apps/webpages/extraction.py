@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from server.config import Settings
+
+from .documents import ParsedDocument, parse_document
+from .image_candidates import is_valid_image_url, rank_image_candidates
+
+try:
+    import lxml  # noqa: F401
+
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+
+def html_parser() -> str:
+    if Settings.html_parser:
+        return Settings.html_parser
+    return "lxml" if LXML_AVAILABLE else "html.parser"
+
+
+def extract_document(
+    source: str, *, base_url: str | None = None, image_options: dict | None = None
+) -> ParsedDocument:
+    """Parse `source` and derive its fields, and image candidates if asked.
+
+    Runs in the extraction processes, so the soup is dropped from the result
+    to keep it small to send back.
+    """
+    document = parse_document(source, parser=html_parser())
+    if image_options is not None:
+        options = dict(image_options)
+        check_svg = not options.pop("with_svg", False)
+        document.image_candidates = rank_image_candidates(
+            document.soup,
+            base_url,
+            source,
+            is_valid=functools.partial(
+                is_valid_image_url, base_url=base_url, check_svg=check_svg
+            ),
+            **options,
+        )
+        document.image_options = image_options
+    document.soup = None
+    return document
+
+
+def extract_text(source: str) -> str:
+    """The visible text of `source`, the only part of the parse sent back."""
+    return parse_document(source, parser=html_parser()).text
+
+
+class ExtractionEngine:
+    """Runs CPU-bound HTML work in a pool of processes.
+
+    The pool is created on first use. With `workers` set to 0 the work runs
+    in a thread instead, which keeps the event loop free but shares the GIL.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor | None:
+        if self.workers <= 0:
+            return None
+        with self.lock:
+            if self._executor is None:
+                # spawned workers do not inherit the event loop, threads or sockets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        call = functools.partial(func, *args, **kwargs)
+        executor = self.executor
+        if executor is None:
+            return await asyncio.to_thread(call)
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+    async def extract(self, source: str, **kwargs) -> ParsedDocument:
+        return await self.run(extract_document, source, **kwargs)
+
+    async def text(self, source: str) -> str:
+        return await self.run(extract_text, source)
+
+    def close(self):
+        with self.lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                logging.info("Extraction engine closed")
+
+
+extraction_engine = ExtractionEngine(Settings.extraction_workers)
@@ -0,0 +1,90 @@
+import hashlib
+import logging
+
+from redis.asyncio.client import Redis
+from server.config import Settings
+from utils.cache import LRUCache
+
+INT_FIELDS = ("width", "height", "status", "content_length")
+
+
+class ImageMetadataCache:
+    """Image url -> metadata shared by all pages, in process and in Redis.
+
+    Metadata is a dict with `status` (200, the HTTP error status, or 0 when
+    the image could not be read), `width`, `height`, `content_length` and
+    `content_type`. Failures are kept for the shorter `negative_ttl`.
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None = None,
+        *,
+        ttl: int | None = None,
+        negative_ttl: int | None = None,
+        local_ttl: int | None = None,
+        max_items: int | None = None,
+    ):
+        self._redis = redis
+        self.ttl = ttl or Settings.image_cache_ttl
+        self.negative_ttl = negative_ttl or Settings.image_cache_negative_ttl
+        self.local_ttl = local_ttl or Settings.image_cache_local_ttl
+        self.local = LRUCache(max_items or Settings.image_cache_items, ttl=self.local_ttl)
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            from server.db import redis
+
+            self._redis = redis
+        return self._redis
+
+    @staticmethod
+    def key(image_url: str) -> str:
+        return f"WEBPAGE:image:{hashlib.sha1(image_url.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def decode(data: dict) -> dict:
+        metadata = {}
+        for field, value in data.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            if isinstance(value, bytes):
+                value = value.decode()
+            metadata[field] = int(value) if field in INT_FIELDS else value
+        return metadata
+
+    async def get(self, image_url: str) -> dict | None:
+        metadata = self.local.get(image_url)
+        if metadata is not None:
+            return metadata
+        try:
+            data = await self.redis.hgetall(self.key(image_url))
+        except Exception as e:
+            logging.warning(f"Could not read image cache for {image_url}: {e}")
+            return None
+        if not data:
+            return None
+        metadata = self.decode(data)
+        self.local.set(image_url, metadata)
+        return metadata
+
+    async def set(self, image_url: str, metadata: dict) -> dict:
+        """Cache `metadata`; return it as later `get` calls will."""
+        ttl = self.ttl if metadata.get("status") == 200 else self.negative_ttl
+        # Redis hashes cannot hold None, keep the local copy the same
+        mapping = {field: value for field, value in metadata.items() if value is not None}
+        self.local.set(image_url, mapping, ttl=min(ttl, self.local_ttl))
+        key = self.key(image_url)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, ttl)
+                await pipe.execute()
+        except Exception as e:
+            logging.warning(f"Could not write image cache for {image_url}: {e}")
+        return mapping
+
+
+image_cache = ImageMetadataCache()
@@ -0,0 +1,226 @@
+import dataclasses
+import re
+from typing import Callable
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse
+
+import validators
+from bs4 import BeautifulSoup
+
+image_url_pattern = re.compile(
+    r"(?:https?:\/\/)?[^\s\"']+\.(?:jpg|jpeg|png|gif|webp|bmp|tiff|ico)(?:\?[^\s\"']*)?",
+    re.IGNORECASE,
+)
+srcset_pattern = re.compile(r"\s*([^\s,][^\s]*)(?:\s+([\d.]+)([wx]))?\s*(?:,|$)")
+# WordPress style thumbnails: photo-300x200.jpg
+size_in_path_pattern = re.compile(r"[-_@](\d{2,4})x(\d{2,4})(?=[._-])")
+skip_pattern = re.compile(
+    r"(?:^|[/_.-])(?:pixel|spacer|blank|transparent|tracking|sprite|1x1)(?:[/_.-]|$)",
+    re.IGNORECASE,
+)
+WIDTH_PARAMS = ("w", "width", "imwidth")
+HEIGHT_PARAMS = ("h", "height")
+# query parameters that only select a rendition of the same image
+VARIANT_PARAMS = {
+    *WIDTH_PARAMS,
+    *HEIGHT_PARAMS,
+    "size",
+    "resize",
+    "fit",
+    "crop",
+    "q",
+    "quality",
+    "dpr",
+    "auto",
+    "fm",
+    "format",
+}
+META_IMAGE_NAMES = ("og:image", "og:image:secure_url", "twitter:image")
+IMG_URL_ATTRIBUTES = ("src", "data-src")
+MIN_ASPECT_RATIO = 0.75
+# width/height attributes are display sizes, the file may be larger (2x, 3x)
+DISPLAY_SIZE_FACTOR = 4
+
+
+@dataclasses.dataclass
+class ImageCandidate:
+    url: str
+    priority: int
+    width: int | None = None
+    height: int | None = None
+    display_width: int | None = None
+    display_height: int | None = None
+
+    @property
+    def size_hint(self) -> int:
+        return self.width or self.display_width or 0
+
+
+def parse_dimension(value) -> int | None:
+    match = re.fullmatch(r"\s*(\d+)(?:px)?\s*", str(value or ""))
+    return int(match.group(1)) if match else None
+
+
+def url_size_hint(url: str) -> tuple[int | None, int | None]:
+    """Intrinsic width and height named in the url, if any."""
+    parsed = urlparse(url)
+    params = dict(parse_qsl(parsed.query))
+    width = next(
+        (parse_dimension(params[p]) for p in WIDTH_PARAMS if p in params), None
+    )
+    height = next(
+        (parse_dimension(params[p]) for p in HEIGHT_PARAMS if p in params), None
+    )
+    match = size_in_path_pattern.search(parsed.path)
+    if match and width is None and height is None:
+        width, height = int(match.group(1)), int(match.group(2))
+    return width, height
+
+
+def variant_key(url: str) -> str:
+    """The url without the parts that select a size or rendition."""
+    parsed = urlparse(url)
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in VARIANT_PARAMS
+    ]
+    path = size_in_path_pattern.sub("", parsed.path)
+    return parsed._replace(path=path, query=urlencode(query), fragment="").geturl()
+
+
+def parse_srcset(srcset: str) -> list[tuple[str, int | None, float | None]]:
+    """(url, width descriptor, density descriptor) of each srcset entry."""
+    entries = []
+    for match in srcset_pattern.finditer(srcset):
+        url, value, unit = match.groups()
+        if not url:
+            continue
+        width = int(float(value)) if unit == "w" else None
+        density = float(value) if unit == "x" else None
+        entries.append((url, width, density))
+    return entries
+
+
+def pick_variant(variants: list[ImageCandidate], max_side: int) -> ImageCandidate:
+    """The largest variant that fits `max_side`, else the smallest one."""
+    fitting = [v for v in variants if v.width is None or v.width <= max_side]
+    if fitting:
+        return max(fitting, key=lambda v: v.width or 0)
+    return min(variants, key=lambda v: v.width)
+
+
+def is_obviously_small(candidate: ImageCandidate, min_side: int) -> bool:
+    """Whether the hints alone show the image cannot pass verification."""
+    if skip_pattern.search(urlparse(candidate.url).path):
+        return True
+    for side in (candidate.width, candidate.height):
+        if side is not None and side < min_side:
+            return True
+    for side in (candidate.display_width, candidate.display_height):
+        if side is not None and side < min_side / DISPLAY_SIZE_FACTOR:
+            return True
+    for width, height in (
+        (candidate.width, candidate.height),
+        (candidate.display_width, candidate.display_height),
+    ):
+        if not (width and height):
+            continue
+        if min(width, height) < max(width, height) * MIN_ASPECT_RATIO:
+            return True
+    return False
+
+
+def is_valid_image_url(img_url: str, base_url: str, check_svg: bool = True) -> bool:
+    full_url = urljoin(base_url, img_url)
+    return (
+        full_url
+        and full_url != base_url
+        and (full_url.startswith("data:image/") or validators.url(full_url))
+        and not (
+            check_svg
+            and (full_url.endswith(".svg") or "data:image/svg+xml" in full_url)
+        )
+    )
+
+
+def collect_candidates(
+    soup: BeautifulSoup, base_url: str, html_source: str, max_side: int
+) -> list[ImageCandidate]:
+    def join_url(url: str) -> str:
+        if url.startswith("https:/") and not url.startswith("https://"):
+            url = url.replace("https:/", "https://", 1)
+        return urljoin(base_url, url)
+
+    def candidate(url: str, priority: int, **hints) -> ImageCandidate:
+        url = join_url(url)
+        width, height = url_size_hint(url)
+        hints.setdefault("width", width)
+        if hints["width"] is None or hints["width"] == width:
+            hints.setdefault("height", height)
+        return ImageCandidate(url=url, priority=priority, **hints)
+
+    candidates = []
+    tag_urls = []
+    for meta in soup.find_all("meta"):
+        name = meta.get("property") or meta.get("name")
+        if name in META_IMAGE_NAMES and meta.get("content"):
+            tag_urls.append(meta["content"])
+            candidates.append(candidate(meta["content"], 0))
+
+    for img in soup.find_all("img"):
+        display_width = parse_dimension(img.get("width"))
+        display_height = parse_dimension(img.get("height"))
+        display = {"display_width": display_width, "display_height": display_height}
+        variants = []
+        for url, width, density in parse_srcset(img.get("srcset") or ""):
+            tag_urls.append(url)
+            if width is None and density and display_width:
+                width = int(display_width * density)
+            variants.append(candidate(url, 1, width=width, **display))
+        for attribute in IMG_URL_ATTRIBUTES:
+            if img.get(attribute):
+                tag_urls.append(img[attribute])
+                variants.append(candidate(img[attribute], 1, **display))
+        if variants:
+            candidates.append(pick_variant(variants, max_side))
+
+    # the markup above already covered the urls it has, with better hints
+    seen = {join_url(url) for url in tag_urls}
+    for url in image_url_pattern.findall(html_source):
+        if join_url(url) not in seen:
+            candidates.append(candidate(url, 2))
+    return candidates
+
+
+def rank_image_candidates(
+    soup: BeautifulSoup,
+    base_url: str,
+    html_source: str,
+    *,
+    min_side: int = 600,
+    max_side: int = 2500,
+    limit: int = 30,
+    is_valid: Callable[[str], bool] | None = None,
+) -> list[str]:
+    """Image urls worth verifying, most promising first and at most `limit`.
+
+    Renditions of the same image are reduced to the best fitting one, and
+    images whose size hints rule them out are dropped without a request.
+    """
+    best: dict[str, ImageCandidate] = {}
+    for candidate in collect_candidates(soup, base_url, html_source, max_side):
+        if is_valid is not None and not is_valid(candidate.url):
+            continue
+        if is_obviously_small(candidate, min_side):
+            continue
+        key = variant_key(candidate.url)
+        current = best.get(key)
+        if current is None:
+            best[key] = candidate
+            continue
+        chosen = pick_variant([current, candidate], max_side)
+        chosen.priority = min(current.priority, candidate.priority)
+        best[key] = chosen
+
+    ranked = sorted(best.values(), key=lambda c: (c.priority, -c.size_hint))
+    return [candidate.url for candidate in ranked[:limit]]
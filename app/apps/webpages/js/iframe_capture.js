@@ -0,0 +1,74 @@
+/**
+ * This file is used to collect the documents of the iframes in a page in one call.
+ * It will run in the browser using selenium's execute_script.
+ * Same-origin frames (and their own frames) are read directly. Invisible frames
+ * and frames whose src matches one of `skipPatterns` are left out, and
+ * cross-origin frames are reported so the caller can decide to switch into them.
+ */
+
+var skipPatterns = arguments[0].map((pattern) => pattern.toLowerCase());
+var maxFrames = arguments[1];
+var maxDepth = 3;
+
+var frames = [];
+var skipped = [];
+
+function isVisible(frame) {
+    var rect = frame.getBoundingClientRect();
+    if (rect.width < 2 || rect.height < 2) {
+        return false;
+    }
+    var style = frame.ownerDocument.defaultView.getComputedStyle(frame);
+    return style.display !== 'none' && style.visibility !== 'hidden';
+}
+
+function isFiltered(src) {
+    src = src.toLowerCase();
+    return skipPatterns.some((pattern) => pattern && src.includes(pattern));
+}
+
+function collect(doc, depth) {
+    var iframes = doc.getElementsByTagName('iframe');
+    for (var i = 0; i < iframes.length; i++) {
+        var frame = iframes[i];
+        var src = frame.src || frame.getAttribute('src') || '';
+        // only top-level frames can be switched into by index
+        var entry = { src: src, index: depth === 0 ? i : null };
+
+        if (frames.length >= maxFrames) {
+            skipped.push(Object.assign(entry, { reason: 'limit' }));
+            continue;
+        }
+        if (isFiltered(src)) {
+            skipped.push(Object.assign(entry, { reason: 'filtered' }));
+            continue;
+        }
+        if (!isVisible(frame)) {
+            skipped.push(Object.assign(entry, { reason: 'hidden' }));
+            continue;
+        }
+
+        var frameDoc = null;
+        try {
+            frameDoc = frame.contentDocument;
+        } catch (e) {
+            frameDoc = null;
+        }
+        if (!frameDoc || !frameDoc.documentElement) {
+            skipped.push(Object.assign(entry, { reason: 'cross_origin' }));
+            continue;
+        }
+        if (!frameDoc.body || !frameDoc.body.innerText.trim()) {
+            skipped.push(Object.assign(entry, { reason: 'empty' }));
+            continue;
+        }
+
+        frames.push(Object.assign(entry, { html: frameDoc.documentElement.outerHTML }));
+        if (depth + 1 < maxDepth) {
+            collect(frameDoc, depth + 1);
+        }
+    }
+}
+
+collect(document, 0);
+return { frames: frames, skipped: skipped };
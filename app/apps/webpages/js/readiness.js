@@ -0,0 +1,63 @@
+/**
+ * This file is used to wait until the page has settled before reading its source.
+ * It will run in the browser using selenium's execute_async_script.
+ * The page is ready when document.readyState is complete and, for `quietMs`,
+ * neither the DOM changed nor a network resource finished loading.
+ * It never waits longer than `maxWaitMs` and reports how long each part took.
+ */
+
+var quietMs = arguments[0];
+var maxWaitMs = arguments[1];
+var callback = arguments[arguments.length - 1];  // This is the callback function provided by Selenium
+
+var start = performance.now();
+var lastActivity = start;
+var readyAt = null;
+
+// Resource entries are added when a request finishes, so a growing count means network activity
+if (performance.setResourceTimingBufferSize) {
+    performance.setResourceTimingBufferSize(10000);
+}
+var resourceCount = performance.getEntriesByType('resource').length;
+
+// Attribute changes are ignored, carousels and animations would never be quiet
+var observer = new MutationObserver(() => {
+    lastActivity = performance.now();
+});
+observer.observe(document.documentElement || document, {
+    childList: true,
+    subtree: true,
+    characterData: true,
+});
+
+function finish(now, ready) {
+    observer.disconnect();
+    callback({
+        ready: ready,
+        waited_ms: Math.round(now - start),
+        ready_state_ms: readyAt === null ? null : Math.round(readyAt - start),
+        resources: resourceCount,
+    });
+}
+
+function check() {
+    var now = performance.now();
+    var count = performance.getEntriesByType('resource').length;
+    if (count !== resourceCount) {
+        resourceCount = count;
+        lastActivity = now;
+    }
+    if (readyAt === null && document.readyState === 'complete') {
+        readyAt = now;
+    }
+
+    if (readyAt !== null && now - lastActivity >= quietMs) {
+        finish(now, true);
+    } else if (now - start >= maxWaitMs) {
+        finish(now, false);
+    } else {
+        setTimeout(check, 50);
+    }
+}
+
+check();
@@ -0,0 +1,46 @@
+import langdetect
+from langdetect import DetectorFactory
+
+# langdetect is random by default, a fixed seed makes results repeatable
+DetectorFactory.seed = 0
+
+
+def sample_chunks(
+    text: str, chunk_size: int = 500, max_samples: int = 20, min_length: int = 50
+) -> list[str]:
+    """Up to `max_samples` chunks spread evenly over the text."""
+    chunks = [
+        chunk
+        for i in range(0, len(text), chunk_size)
+        if len((chunk := text[i : i + chunk_size]).strip()) >= min_length
+    ]
+    if len(chunks) <= max_samples:
+        return chunks
+    step = len(chunks) / max_samples
+    return [chunks[int(i * step)] for i in range(max_samples)]
+
+
+def detect_languages(text: str, *, max_samples: int = 20) -> dict[str, float]:
+    """Share in percent of each language over sampled chunks of `text`.
+
+    All samples are detected, so the shares hold for any invalid languages
+    and threshold a caller later checks them against.
+    """
+    counts: dict[str, int] = {}
+    for chunk in sample_chunks(text, max_samples=max_samples):
+        try:
+            lang = langdetect.detect(chunk)
+        except langdetect.LangDetectException:
+            continue
+        counts[lang] = counts.get(lang, 0) + 1
+
+    total = sum(counts.values())
+    if not total:
+        return {}
+    return {lang: count * 100 / total for lang, count in counts.items()}
+
+
+def is_valid_language(
+    languages: dict[str, float], invalid_languages: list[str], threshold: float = 20.0
+) -> bool:
+    return not any(languages.get(lang, 0) > threshold for lang in invalid_languages)
@@ -1,42 +1,135 @@
+import logging
 import re
-from urllib.parse import urlparse
+import uuid
 
 from fastapi_mongo_base.models import BaseEntity
-from pymongo import ASCENDING, IndexModel
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from server.queue import BULK, INTERACTIVE, ReliableQueue
+from utils.urltools import canonicalize_url
 
-from .schemas import WebpageSchema
+from .schemas import DERIVED_FIELDS_VERSION, WebpageCreateSchema, WebpageSchema
 
 
 class Webpage(WebpageSchema, BaseEntity):
     class Settings:
         indexes = BaseEntity.Settings.indexes + [
             IndexModel([("url", ASCENDING)], unique=True),
+            # documents stored before url_key was set save it as null
+            IndexModel(
+                [("url_key", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"url_key": {"$type": "string"}},
+            ),
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("is_deleted", ASCENDING),
+                    ("created_at", DESCENDING),
+                ]
+            ),
+            IndexModel([("derived_version", ASCENDING)]),
         ]
 
     @classmethod
     async def get_by_url(cls, url: str, *, skip_uid=None) -> "Webpage":
-        parsed = urlparse(url)
-        netloc = parsed.netloc
-        path = parsed.path or "/"
-        query = parsed.query
-
-        webpages = await cls.search_by_url(netloc)
-        for webpage in webpages:
-            if skip_uid and webpage.uid == skip_uid:
-                continue
-            webpage_parsed = urlparse(webpage.url)
-            webpage_netloc = webpage_parsed.netloc
-            webpage_path = webpage_parsed.path or "/"
-            webpage_query = webpage_parsed.query
-            if (
-                netloc == webpage_netloc
-                and path == webpage_path
-                and query == webpage_query
-            ):
-                return webpage
+        query = {"url_key": canonicalize_url(url)}
+        if skip_uid:
+            query["uid"] = {"$ne": skip_uid}
+        webpage = await cls.find_one(query)
+        if webpage:
+            return webpage
 
+        # documents stored before url_key was introduced
         return await cls.find_one(cls.url == url)
 
+    @classmethod
+    async def create_item(cls, data: dict) -> "Webpage":
+        # url_key is only written on insert or by `migrate_url_keys`
+        data["url_key"] = canonicalize_url(data["url"])
+        return await super().create_item(data)
+
+    @classmethod
+    async def migrate_url_keys(cls, batch_size: int = 500):
+        """Set `url_key` on documents stored without it or with the old key.
+
+        Keys used to keep the scheme, so http and https urls of a page could
+        be stored twice; the later duplicate keeps a key suffixed by its uid.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        collection = cls.get_motor_collection()
+        outdated = {"$or": [{"url_key": None}, {"url_key": {"$regex": "^https?://"}}]}
+        while True:
+            documents = (
+                await collection.find(outdated, {"_id": 1, "uid": 1, "url": 1})
+                .sort("created_at", ASCENDING)
+                .limit(batch_size)
+                .to_list(batch_size)
+            )
+            if not documents:
+                break
+            for document in documents:
+                url_key = canonicalize_url(document["url"])
+                try:
+                    await collection.update_one(
+                        {"_id": document["_id"]}, {"$set": {"url_key": url_key}}
+                    )
+                except DuplicateKeyError:
+                    # an older document already owns the key, keep this one unique
+                    logging.warning(f"Duplicate webpage for {url_key}: {document['uid']}")
+                    await collection.update_one(
+                        {"_id": document["_id"]},
+                        {"$set": {"url_key": f"{url_key}#{document['uid']}"}},
+                    )
+            logging.info(f"Migrated url_key for {len(documents)} webpages")
+
+    @classmethod
+    async def get_or_create_many(
+        cls, items: list[WebpageCreateSchema], user_id=None
+    ) -> list["Webpage"]:
+        """Webpages of `items` in order, creating the missing ones in one insert."""
+        from pymongo.errors import BulkWriteError
+
+        def query(keys, urls):
+            return {
+                "$or": [
+                    {"url_key": {"$in": list(keys)}},
+                    # documents stored before url_key was introduced
+                    {"url": {"$in": list(urls)}},
+                ]
+            }
+
+        keys = [canonicalize_url(item.url) for item in items]
+        found = await cls.find(query(set(keys), {item.url for item in items})).to_list()
+        webpages = {webpage.canonical_key: webpage for webpage in found}
+
+        new: dict[str, Webpage] = {}
+        for item, key in zip(items, keys):
+            if key not in webpages and key not in new:
+                new[key] = cls(
+                    uid=str(uuid.uuid4()),
+                    user_id=user_id,
+                    url=item.url,
+                    url_key=key,
+                    meta_data=item.meta_data,
+                )
+        if new:
+            try:
+                result = await cls.insert_many(list(new.values()), ordered=False)
+                # insert_many leaves the ids unset, later saves would insert again
+                for webpage, inserted_id in zip(new.values(), result.inserted_ids):
+                    webpage.id = inserted_id
+                webpages.update(new)
+            except BulkWriteError:
+                # some urls were created concurrently, read back the stored ones
+                urls = {webpage.url for webpage in new.values()}
+                stored = await cls.find(query(new, urls)).to_list()
+                by_key = {webpage.canonical_key: webpage for webpage in stored}
+                by_url = {webpage.url: webpage for webpage in stored}
+                for key, webpage in new.items():
+                    webpages[key] = by_key.get(key) or by_url[webpage.url]
+        return [webpages[key] for key in keys]
+
     @classmethod
     async def search_by_url(cls, partial_url) -> list["Webpage"]:
         escaped_partial_url = re.escape(partial_url)
@@ -45,19 +138,172 @@ class Webpage(WebpageSchema, BaseEntity):
         results: list[Webpage] = await Webpage.find(query).to_list()
         return results
 
+    @classmethod
+    async def outdated_derived_fields(cls, limit: int = 100) -> list["Webpage"]:
+        query = {
+            "$or": [
+                {"derived_version": {"$exists": False}},
+                {"derived_version": {"$lt": DERIVED_FIELDS_VERSION}},
+            ]
+        }
+        return await cls.find(query).limit(limit).to_list()
+
     async def start_processing(self, **kwargs):
         from . import services
 
         return await services.fetch_webpage(self, **kwargs)
 
-    async def push_to_queue(self, **kwargs):
-        """Add the task to Redis queue"""
-        import json
+    @classmethod
+    def queue(cls) -> ReliableQueue:
+        return ReliableQueue(f"{cls.__name__.lower()}_queue")
+
+    @property
+    def queued_key(self) -> str:
+        return f"WEBPAGE:queued:{self.canonical_key}"
+
+    @property
+    def queued_overrides_key(self) -> str:
+        return f"{self.queued_key}:overrides"
+
+    @staticmethod
+    def queue_overrides(kwargs: dict) -> dict:
+        """What a duplicate request asks for beyond the job already queued."""
+        overrides = {}
+        if kwargs.get("force_refetch"):
+            overrides["force_refetch"] = "1"
+        if kwargs.get("crawl_method"):
+            overrides["crawl_method"] = kwargs["crawl_method"]
+        return overrides
+
+    async def pop_queued_overrides(self) -> dict:
+        """Overrides merged into this queued job by duplicate requests."""
+        from server import db
+
+        async with db.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(self.queued_overrides_key)
+            pipe.delete(self.queued_overrides_key)
+            overrides, _ = await pipe.execute()
+        overrides = {
+            (k.decode() if isinstance(k, bytes) else k): (
+                v.decode() if isinstance(v, bytes) else v
+            )
+            for k, v in overrides.items()
+        }
+        if "force_refetch" in overrides:
+            overrides["force_refetch"] = True
+        return overrides
 
+    @staticmethod
+    def tenant(user_id=None) -> str:
+        return str(user_id) if user_id else "anonymous"
+
+    @classmethod
+    async def queue_lane(cls, meta_data: dict | None, user_id=None) -> str:
+        """The lane of a single task: its priority, then the tenant it is fair to.
+
+        Tasks are interactive unless `meta_data` asks for bulk. A tenant whose
+        interactive lane already holds a backlog is served from the bulk lane
+        instead, so it cannot crowd out the others one request at a time.
+        """
+        return (await cls.queue_lanes([meta_data], user_id))[0]
+
+    @classmethod
+    async def queue_lanes(
+        cls, meta_datas: list[dict | None], user_id=None
+    ) -> list[str]:
+        """`queue_lane` of many tasks of a tenant, counting the earlier ones.
+
+        Tasks fill the interactive lane up to its backlog, the rest go bulk.
+        """
+        from server.config import Settings
+
+        if not meta_datas:
+            return []
+        tenant = cls.tenant(user_id)
+        interactive = ReliableQueue.lane(INTERACTIVE, tenant)
+        room = Settings.queue_interactive_backlog - await cls.queue().lane_length(
+            interactive
+        )
+        lanes = []
+        for meta_data in meta_datas:
+            if (meta_data or {}).get("priority") != BULK and room > 0:
+                room -= 1
+                lanes.append(interactive)
+            else:
+                lanes.append(ReliableQueue.lane(BULK, tenant))
+        return lanes
+
+    async def push_to_queue(self, *, user_id=None, **kwargs) -> bool:
+        """Add the task to Redis queue unless this url is already queued"""
+        from server import db
+        from server.config import Settings
+
+        if not await db.redis.set(
+            self.queued_key, self.uid, nx=True, ex=Settings.queue_visibility_timeout
+        ):
+            overrides = self.queue_overrides(kwargs)
+            if overrides:
+                async with db.redis.pipeline(transaction=True) as pipe:
+                    pipe.hset(self.queued_overrides_key, mapping=overrides)
+                    pipe.expire(
+                        self.queued_overrides_key, Settings.queue_visibility_timeout
+                    )
+                    await pipe.execute()
+                logging.info(f"{self.url} is already queued, merged {overrides}")
+            else:
+                logging.info(f"{self.url} is already queued")
+            return False
+        lane = await self.queue_lane(kwargs.get("meta_data"), user_id or self.user_id)
+        await self.queue().push(
+            kwargs | self.model_dump(include={"uid"}, mode="json"), lane=lane
+        )
+        return True
+
+    @classmethod
+    async def push_many_to_queue(
+        cls, entries: list[tuple["Webpage", dict]], user_id=None
+    ) -> list[bool]:
+        """`push_to_queue` for many webpages with pipelined Redis round trips."""
         from server import db
+        from server.config import Settings
+
+        async with db.redis.pipeline(transaction=False) as pipe:
+            for webpage, _ in entries:
+                pipe.set(
+                    webpage.queued_key,
+                    webpage.uid,
+                    nx=True,
+                    ex=Settings.queue_visibility_timeout,
+                )
+            acquired = [bool(result) for result in await pipe.execute()]
 
-        queue_name = f"{self.__class__.__name__.lower()}_queue"
-        await db.redis.lpush(
-            queue_name,
-            json.dumps(kwargs | self.model_dump(include={"uid"}, mode="json")),
+        async with db.redis.pipeline(transaction=False) as pipe:
+            for (webpage, kwargs), queued in zip(entries, acquired):
+                overrides = webpage.queue_overrides(kwargs)
+                if queued or not overrides:
+                    continue
+                pipe.hset(webpage.queued_overrides_key, mapping=overrides)
+                pipe.expire(
+                    webpage.queued_overrides_key, Settings.queue_visibility_timeout
+                )
+            await pipe.execute()
+
+        tasks = [
+            kwargs | webpage.model_dump(include={"uid"}, mode="json")
+            for (webpage, kwargs), queued in zip(entries, acquired)
+            if queued
+        ]
+        by_lane: dict[str, list[dict]] = {}
+        lanes = await cls.queue_lanes(
+            [task.get("meta_data") for task in tasks], user_id
         )
+        for task, lane in zip(tasks, lanes):
+            by_lane.setdefault(lane, []).append(task)
+        for lane, payloads in by_lane.items():
+            await cls.queue().push_many(payloads, lane=lane)
+        return acquired
+
+    async def release_queued(self):
+        from server import db
+
+        await db.redis.delete(self.queued_key, self.queued_overrides_key)
@@ -1,11 +1,15 @@
 import uuid
+from datetime import datetime
 
-from fastapi import BackgroundTasks, Request
+from fastapi import BackgroundTasks, Body, Request
+from fastapi.responses import StreamingResponse
 from fastapi_mongo_base.routes import AbstractTaskRouter
+from server.config import Settings
 from usso.fastapi.integration import jwt_access_security
 
 from .models import Webpage
 from .schemas import (
+    WebpageBatchItemSchema,
     WebpageCreateSchema,
     WebpageDetailSchema,
     WebpageListSchema,
@@ -32,6 +36,17 @@ class WebpageRouter(AbstractTaskRouter[Webpage, WebpageSchema]):
             response_model=self.list_response_schema,
             status_code=200,
         )
+        self.router.add_api_route(
+            "/queue",
+            self.queue_stats,
+            methods=["GET"],
+        )
+        self.router.add_api_route(
+            "/export",
+            self.export_items,
+            methods=["GET"],
+            response_class=StreamingResponse,
+        )
         self.router.add_api_route(
             "/{uid:uuid}",
             self.retrieve_item,
@@ -46,6 +61,13 @@ class WebpageRouter(AbstractTaskRouter[Webpage, WebpageSchema]):
             response_model=self.create_response_schema,
             status_code=201,
         )
+        self.router.add_api_route(
+            "/batch",
+            self.create_batch,
+            methods=["POST"],
+            response_model=list[WebpageBatchItemSchema],
+            status_code=201,
+        )
         self.router.add_api_route(
             "/{uid:uuid}/text",
             self.get_text,
@@ -74,13 +96,14 @@ class WebpageRouter(AbstractTaskRouter[Webpage, WebpageSchema]):
         background_tasks: BackgroundTasks,
         # sync: bool = False,
     ):
+        user_id = await self.get_user_id(request)
         webpage: Webpage = await Webpage.get_by_url(data.url)
         if not webpage:
             webpage: Webpage = await super(AbstractTaskRouter, self).create_item(
-                request, data.model_dump()
+                request, data.model_dump(exclude={"crawl_method"})
             )
 
-        if not webpage.check_cache() or data.force_refetch:
+        if not await webpage.check_cache() or data.force_refetch:
             # webpage.page_source = None
             webpage.task_status = "init"
             await webpage.save()
@@ -90,12 +113,89 @@ class WebpageRouter(AbstractTaskRouter[Webpage, WebpageSchema]):
             # background_tasks.add_task(
             #     webpage.start_processing, force_refetch=data.force_refetch
             # )
-            await webpage.push_to_queue(**data.model_dump())
+            await webpage.push_to_queue(user_id=user_id, **data.model_dump())
 
         return webpage
 
+    async def create_batch(
+        self,
+        request: Request,
+        data: list[WebpageCreateSchema] = Body(
+            min_length=1, max_length=Settings.batch_max_items
+        ),
+    ):
+        """`create_item` for many urls with bulk database and queue round trips."""
+        from .storage import source_store
+
+        user_id = await self.get_user_id(request)
+        webpages = await Webpage.get_or_create_many(data, user_id=user_id)
+
+        # the first item of a url decides how it is queued
+        entries: dict[str, tuple[Webpage, WebpageCreateSchema]] = {}
+        for webpage, item in zip(webpages, data):
+            entries.setdefault(webpage.uid, (webpage, item))
+
+        fresh = [webpage for webpage, _ in entries.values() if not webpage.expired()]
+        stored = await source_store.exists_many([webpage.url for webpage in fresh])
+        cached = {webpage.uid for webpage, exists in zip(fresh, stored) if exists}
+        refetch = [
+            uid
+            for uid, (_, item) in entries.items()
+            if uid not in cached or item.force_refetch
+        ]
+        if refetch:
+            await Webpage.get_motor_collection().update_many(
+                {"uid": {"$in": refetch}}, {"$set": {"task_status": "init"}}
+            )
+            for uid in refetch:
+                entries[uid][0].task_status = "init"
+
+        queued = await Webpage.push_many_to_queue(
+            [(webpage, item.model_dump()) for webpage, item in entries.values()],
+            user_id=user_id,
+        )
+        queued = dict(zip(entries, queued))
+        return [
+            WebpageBatchItemSchema(
+                uid=webpage.uid,
+                url=webpage.url,
+                task_status=webpage.task_status,
+                queued=queued[webpage.uid],
+            )
+            for webpage in webpages
+        ]
+
+    async def export_items(
+        self,
+        request: Request,
+        status: str | None = None,
+        domain: str | None = None,
+        updated_at_from: datetime | None = None,
+        updated_at_to: datetime | None = None,
+        with_text: bool = True,
+    ):
+        """Stream the user's webpages as newline delimited JSON records."""
+        from .export import export_query, export_records, ndjson_lines
+
+        query = export_query(
+            await self.get_user_id(request),
+            status=status,
+            domain=domain,
+            updated_at_from=updated_at_from,
+            updated_at_to=updated_at_to,
+        )
+        return StreamingResponse(
+            ndjson_lines(export_records(query, with_text=with_text)),
+            media_type="application/x-ndjson",
+        )
+
+    async def queue_stats(self, request: Request):
+        return await Webpage.queue().stats()
+
     async def get_text(self, request: Request, uid: uuid.UUID):
         item: Webpage = await self.get_item(uid)
+        await item.load_page_source()
+        await item.parse()
         return {"text": item.text}
 
     async def get_images(
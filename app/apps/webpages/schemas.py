@@ -1,44 +1,142 @@
+import asyncio
 import datetime
+import json
 import uuid
 from typing import Literal
 
 from fastapi_mongo_base.schemas import BaseEntitySchema
 from fastapi_mongo_base.tasks import TaskMixin
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
+from utils.urltools import canonicalize_url
+
+from .documents import ParsedDocument, content_hash, parse_document
+
+DERIVED_FIELDS_VERSION = 4
+# languages stored before this version are partial, detection used to stop early
+FULL_LANGUAGES_VERSION = 4
+
+# written by `update_derived_fields`, so they can be stored on their own
+DERIVED_FIELDS = {
+    "main_domain",
+    "languages",
+    "source_hash",
+    "normalized_hash",
+    "title",
+    "meta_text",
+    "text_length",
+    "derived_version",
+}
+
+CrawlMethod = Literal["direct", "embedded", "browser"]
 
 
 class WebpageCreateSchema(BaseModel):
     url: str
     force_refetch: bool = False
+    crawl_method: CrawlMethod | None = None
     meta_data: dict = {}
 
 
+class WebpageBatchItemSchema(BaseModel):
+    uid: str
+    url: str
+    task_status: str
+    queued: bool
+
+
 class WebpageSchema(BaseEntitySchema, TaskMixin):
     user_id: uuid.UUID | None = None
 
     url: str = Field(json_schema_extra={"index": True, "unique": True})
-    crawl_method: Literal["direct", "browser"] = "direct"
+    url_key: str | None = None
+    crawl_method: CrawlMethod = "direct"
     images: list[str] | None = None
+    images_hash: str | None = None
+
+    title: str | None = None
+    meta_text: str | None = None
+    text_length: int | None = None
+    main_domain: str | None = None
+    derived_version: int = 0
+    source_hash: str | None = None
+    normalized_hash: str | None = None
+    languages: dict[str, float] | None = None
+    fetch_timings: dict | None = None
+    # the source was cut at `httpx_max_body_bytes`
+    truncated: bool = False
+    iframes: list[dict] | None = None
+    etag: str | None = None
+    last_modified: str | None = None
 
     # screenshot: str | None = None
     # google_data: dict | None = None
 
+    _page_source: str | None = PrivateAttr(default=None)
+    _page_source_loaded: bool = PrivateAttr(default=False)
+    _source_hash: str | None = PrivateAttr(default=None)
+    _document: ParsedDocument | None = PrivateAttr(default=None)
+
+    @property
+    def canonical_key(self) -> str:
+        """`url_key`, or the key of documents stored before it was set."""
+        return self.url_key or canonicalize_url(self.url)
+
     @property
-    def page_source(self):
-        from server.db import redis_sync as redis
+    def page_source(self) -> str | None:
+        """The page source loaded by `load_page_source`, without any I/O."""
+        return self._page_source
+
+    async def load_page_source(self) -> str | None:
+        if not self._page_source_loaded:
+            from .storage import source_store
+
+            self._cache_page_source(await source_store.get(self.url))
+        return self._page_source
+
+    async def save_page_source(self, value: str | None) -> bool:
+        """Store the source; return whether it differs from the stored one.
 
-        value = redis.get(f"WEBPAGE:source:{self.url}")
-        if value:
-            return value.decode("utf-8")
-        return None
+        An identical source is not rewritten, only its time to live restarts.
+        """
+        from .storage import source_store
 
-    @page_source.setter
-    def page_source(self, value: str):
-        from server.db import redis_sync as redis
+        if value is None:
+            changed = self.source_hash is not None
+            await source_store.delete(self.url)
+            self.source_hash = None
+        else:
+            value = str(value)
+            digest = content_hash(value)
+            changed = digest != self.source_hash
+            if changed or not await source_store.touch(self.url):
+                await source_store.set(self.url, value)
+            self.source_hash = digest
+        self._cache_page_source(value)
+        return changed
 
-        redis.set(f"WEBPAGE:source:{self.url}", str(value), ex=60 * 60 * 4)
+    async def touch_page_source(self) -> bool:
+        """Keep the stored source for another TTL, e.g. after a 304 response."""
+        from .storage import source_store
 
-    def expired(self, hours: int = 4):
+        return await source_store.touch(self.url)
+
+    def _cache_page_source(self, value: str | None):
+        self._page_source = value
+        self._page_source_loaded = True
+        self._source_hash = content_hash(value) if value is not None else None
+        if self._document and self._document.source_hash != self._source_hash:
+            self._document = None
+
+    def expired(self, hours: int | None = None):
+        """Whether the page is due for a refetch.
+
+        This is freshness, not storage: the source tiers keep sources longer
+        (`SOURCE_DISK_TTL`) so stale pages can still be read and exported, but
+        a page older than `webpage_cache_hours` is fetched again.
+        """
+        from server.config import Settings
+
+        hours = hours or Settings.webpage_cache_hours
         return (
             datetime.datetime.now() - self.updated_at
         ).total_seconds() / 3600 > hours
@@ -49,67 +147,132 @@ class WebpageSchema(BaseEntitySchema, TaskMixin):
             value = f"https://{value}"
         return value
 
-    @property
-    def main_domain(self):
-        from .services import get_main_domain
-
-        return get_main_domain(self.url)
-
     def __repr__(self):
         return f"<{self.__class__.__name__} {self.url}, {self.crawl_method}>"
 
-    def check_cache(self):
-        return self.page_source and not self.expired()
+    async def check_cache(self):
+        from .storage import source_store
+
+        if self.expired():
+            return False
+        if self._page_source_loaded:
+            return bool(self._page_source)
+        return await source_store.exists(self.url)
 
     @property
-    def soup(self):
-        from bs4 import BeautifulSoup
+    def document(self) -> ParsedDocument | None:
+        source = self.page_source
+        if source is None:
+            self._document = None
+            return None
+        if self._document is None or self._document.source_hash != self._source_hash:
+            from .extraction import html_parser
 
-        if self.page_source is None:
+            # same parser as the extraction engine, so the derived fields agree
+            self._document = parse_document(source, parser=html_parser())
+        return self._document
+
+    async def parse(self, **kwargs) -> ParsedDocument | None:
+        """Parse the loaded source in the extraction engine, off the event loop.
+
+        The sync accessors then use the result; `kwargs` are passed to
+        `extract_document`, e.g. `image_options`.
+        """
+        from .extraction import extraction_engine
+
+        source = self.page_source
+        if source is None:
             return None
-        return BeautifulSoup(self.page_source, "html.parser")
+        document = self._document
+        image_options = kwargs.get("image_options")
+        if (
+            document is None
+            or document.source_hash != self._source_hash
+            or (image_options is not None and document.image_options != image_options)
+        ):
+            document = await extraction_engine.extract(
+                source, base_url=self.url, **kwargs
+            )
+            self._document = document
+        return document
 
     @property
-    def text(self):
-        from fastapi_mongo_base.utils import texttools
+    def soup(self):
+        """The soup of the parsed source; engine parses need `load_soup` first."""
+        document = self.document
+        return document.soup if document else None
 
-        if not self.soup:
-            return ""
-        text_content = self.soup.get_text(separator=" ").strip()
-        return texttools.remove_whitespace(text_content)
+    async def load_soup(self):
+        """Parse the loaded source into a soup in a thread, with the engine's parser.
 
-    @property
-    def meta_text(self):
-        if not self.soup:
-            return
-        return "\n".join(
-            [
-                tag.get("content")
-                for tag in self.soup.find_all("meta")
-                if tag.get("content")
-            ]
+        Documents from the extraction engine do not carry their soup, which
+        is too large to send back from its processes.
+        """
+        from .extraction import html_parser
+
+        document = await self.parse()
+        if document is None or document.soup is not None:
+            return document.soup if document else None
+        parsed = await asyncio.to_thread(
+            parse_document, self.page_source, parser=html_parser()
         )
+        parsed.image_candidates = document.image_candidates
+        parsed.image_options = document.image_options
+        if self._document is document:
+            self._document = parsed
+        return parsed.soup
 
     @property
-    def title(self):
-        if not self.soup:
-            return
-        title = self.soup.find("title")
-        if title:
-            return title.get_text().strip()
+    def text(self):
+        document = self.document
+        return document.text if document else ""
 
     def is_enough_text(self):
-        return self.text and len(self.text) > 500
+        document = self.document
+        return document is not None and document.is_enough_text()
+
+    def images_key(self, options: dict) -> str | None:
+        """Hash of the content and the options `images` are extracted with."""
+        if not self.normalized_hash:
+            return None
+        return content_hash(
+            json.dumps([self.normalized_hash, options], sort_keys=True, default=str)
+        )
+
+    def images_unchanged(self, options: dict) -> bool:
+        """Whether `images` were extracted from equal content with `options`."""
+        key = self.images_key(options)
+        return key is not None and self.images_hash == key
+
+    def update_derived_fields(self):
+        """Store the fields served by list views so they never need the source."""
+        from .services import get_main_domain
+
+        self.main_domain = get_main_domain(self.url)
+        document = self.document
+        if document:
+            if (
+                document.normalized_hash != self.normalized_hash
+                or self.derived_version < FULL_LANGUAGES_VERSION
+            ):
+                self.languages = None
+            self.source_hash = document.source_hash
+            self.normalized_hash = document.normalized_hash
+            self.title = document.title
+            self.meta_text = document.meta_text
+            self.text_length = len(document.text)
+        self.derived_version = DERIVED_FIELDS_VERSION
 
 
 class WebpageListSchema(BaseEntitySchema, TaskMixin):
     user_id: uuid.UUID | None = None
 
     url: str = Field(json_schema_extra={"index": True, "unique": True})
-    crawl_method: Literal["direct", "browser"] = "direct"
+    crawl_method: CrawlMethod = "direct"
     title: str | None = None
     main_domain: str | None = None
     meta_text: str | None = None
+    text_length: int | None = None
 
 
 class WebpageDetailSchema(WebpageSchema):
@@ -1,40 +1,43 @@
 import asyncio
 import binascii
+import codecs
 import logging
 import re
 import time
-from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from pathlib import Path
-from urllib.parse import urljoin
 
 import httpx
-import langdetect
-import validators
-from bs4 import BeautifulSoup
 from fastapi_mongo_base.tasks import TaskStatusEnum
 from fastapi_mongo_base.utils import basic, imagetools
 from googleapiclient.discovery import build
-from PIL import Image, ImageFile
+from PIL import ImageFile
 from selenium import webdriver
 from selenium.common.exceptions import (
     NoSuchWindowException,
     StaleElementReferenceException,
     TimeoutException,
 )
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-from selenium.webdriver.support.ui import WebDriverWait
 from server.config import Settings
-
+from server.http_client import http_client
+from server.singleflight import RedisLease, SingleFlight
+from utils.imagesize import get_image_size, image_format
+
+from .browser import browser_pool, load_script, wait_until_ready
+from .documents import with_embedded_content
+from .extraction import extraction_engine
+from .image_cache import image_cache
+from .language import detect_languages, is_valid_language
 from .models import Webpage
+from .schemas import DERIVED_FIELDS, DERIVED_FIELDS_VERSION
+from .strategy import CRAWL_METHODS, domain_strategies
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
-image_url_pattern = re.compile(
-    r"(?:https?:\/\/)?[^\s\"']+\.(?:jpg|jpeg|png|gif|webp|bmp|tiff|ico)(?:\?[^\s\"']*)?",
-    re.IGNORECASE,
-)
 
 semaphore = asyncio.Semaphore(4)
+fetch_flights = SingleFlight()
+# give up when the fetch lease is taken again by another worker this often
+FETCH_LEASE_ATTEMPTS = 3
 image_limit_semaphore = asyncio.Semaphore(4)  # adjust the limit as necessary
 
 
@@ -51,19 +54,89 @@ def get_main_domain(url: str) -> str:
     return main_domain
 
 
+charset_pattern = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+
+def get_decoder(response: httpx.Response, head: bytes) -> codecs.IncrementalDecoder:
+    """Incremental decoder for the header charset, else a `<meta charset>`."""
+    encoding = response.charset_encoding
+    if not encoding:
+        match = charset_pattern.search(head[:4096])
+        encoding = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
 @basic.try_except_wrapper
-async def fetch_webpage_direct(webpage: Webpage, **kwargs) -> dict | None:
+async def fetch_webpage_direct(
+    webpage: Webpage, *, conditional: bool = False, **kwargs
+) -> dict | None:
+    """Stream the page, rejecting non-HTML from the headers and capping its size.
+
+    With `conditional`, the stored validators are sent and an unchanged page
+    returns `{"not_modified": True}`.
+    """
     if "https://www.reddit.com" in webpage.url:
         return None
     try:
         follow_redirects = kwargs.pop("follow_redirects", True)
-
-        async with httpx.AsyncClient(follow_redirects=follow_redirects) as client:
-            response = await client.get(webpage.url, timeout=Settings.httpx_timeout)
-            response.raise_for_status()
-            if not response.headers.get("Content-Type", "").startswith("text/html"):
-                return {"error": "not_html"}
-            return {"source_code": response.text}  # Return page content if successful
+        max_bytes = Settings.httpx_max_body_bytes
+        headers = {}
+        if conditional and webpage.etag:
+            headers["If-None-Match"] = webpage.etag
+        if conditional and webpage.last_modified:
+            headers["If-Modified-Since"] = webpage.last_modified
+
+        client = http_client.get_client()
+        async with http_client.host_slot(webpage.url):
+            async with client.stream(
+                "GET",
+                webpage.url,
+                headers=headers,
+                follow_redirects=follow_redirects,
+                timeout=Settings.httpx_timeout,
+            ) as response:
+                if headers and response.status_code == 304:
+                    # a 304 may carry updated validators
+                    return {
+                        "not_modified": True,
+                        "etag": response.headers.get("ETag") or webpage.etag,
+                        "last_modified": response.headers.get("Last-Modified")
+                        or webpage.last_modified,
+                    }
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+                if not content_type.startswith(("text/html", "application/xhtml")):
+                    return {"error": "not_html"}
+
+                decoder = None
+                parts: list[str] = []
+                received = 0
+                truncated = False
+                async for chunk in response.aiter_bytes():
+                    if decoder is None:
+                        decoder = get_decoder(response, chunk)
+                    if received + len(chunk) > max_bytes:
+                        chunk = chunk[: max_bytes - received]
+                        truncated = True
+                    received += len(chunk)
+                    parts.append(decoder.decode(chunk))
+                    if truncated:
+                        logging.warning(
+                            f"Truncated `{webpage.url}` at {max_bytes} bytes"
+                        )
+                        break
+                if decoder is not None:
+                    parts.append(decoder.decode(b"", final=True))
+                # Return page content if successful
+                return {
+                    "source_code": "".join(parts),
+                    "truncated": truncated,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
     except httpx.HTTPStatusError as e:
         if e.response.status_code == 403:
             return {"error": "permission_denied"}
@@ -116,95 +189,105 @@ async def fetch_webpage_dynamic(webpage: Webpage, **kwargs):
 
         return screenshot_bytes
 
-    def get_source_with_iframes(driver: webdriver.Remote):
-        try:
-            WebDriverWait(driver, Settings.selenium_loading_time).until(
-                lambda d: d.execute_script("return document.readyState") == "complete"
-            )
-        except TimeoutException as e:
-            logging.warning(f"Page did not load in time: {e}")
+    def get_source_with_iframes(driver: webdriver.Remote) -> tuple[str, list[dict]]:
+        """Return the page source with its iframe documents and what was included.
 
+        Same-origin frames are collected by one script; visible cross-origin
+        frames are switched into one by one while the iframe budget lasts.
+        """
+        deadline = time.monotonic() + Settings.selenium_iframe_budget
         main_page_source = driver.page_source
-        iframes = driver.find_elements("tag name", "iframe")
-        iframe_contents = []
+        try:
+            capture = driver.execute_script(
+                load_script("iframe_capture.js"),
+                Settings.selenium_iframe_skip.split(","),
+                Settings.selenium_iframe_max,
+            )
+        except Exception as e:
+            logging.warning(f"Error capturing iframes: {type(e)} {e}")
+            return main_page_source, []
 
-        for _ in range(len(iframes)):
-            iframes = driver.find_elements("tag name", "iframe")  # Refresh iframe list
-            iframe = iframes[_]
+        iframe_contents = [frame.pop("html") for frame in capture["frames"]]
+        frames = [frame | {"included": True} for frame in capture["frames"]]
 
-        for iframe in iframes:
+        cross_origin = []
+        for frame in capture["skipped"]:
+            if frame["reason"] == "cross_origin" and frame["index"] is not None:
+                cross_origin.append(frame)
+            else:
+                frames.append(frame | {"included": False})
+
+        elements = driver.find_elements("tag name", "iframe") if cross_origin else []
+        for frame in cross_origin:
+            if (
+                time.monotonic() >= deadline
+                or len(iframe_contents) >= Settings.selenium_iframe_max
+            ):
+                frames.append(frame | {"included": False, "reason": "budget"})
+                continue
             try:
-                if iframe.is_displayed():
-                    driver.switch_to.frame(iframe)
-                    WebDriverWait(driver, Settings.selenium_loading_time).until(
-                        lambda d: d.execute_script("return document.readyState")
-                        == "complete"
-                    )
-                    iframe_contents.append(driver.page_source)
-            except TimeoutException:
-                logging.warning(
-                    f"IFrame did not load in time: {iframe.get_attribute('src')}"
-                )
-            except NoSuchWindowException as e:
-                logging.warning(
-                    f"NoSuchWindowError: The browser window was closed or discarded. {e}"
-                )
-            except StaleElementReferenceException as e:
-                logging.warning(
-                    f"StaleElementReferenceError: The element is no longer attached to the DOM. {e}"
-                )
+                driver.switch_to.frame(elements[frame["index"]])
+                iframe_contents.append(driver.page_source)
+                frames.append(frame | {"included": True})
+            except (
+                IndexError,
+                NoSuchWindowException,
+                StaleElementReferenceException,
+            ) as e:
+                logging.warning(f"IFrame {frame['src']} is gone: {type(e)} {e}")
+                frames.append(frame | {"included": False, "reason": "gone"})
             except Exception as e:
                 logging.warning(f"Error fetching iframe content: {e}")
+                frames.append(frame | {"included": False, "reason": "error"})
             finally:
                 driver.switch_to.default_content()
 
         full_page_source = main_page_source + "\n".join(iframe_contents)
-        return full_page_source
+        return full_page_source, frames
 
     def browser_fetch(webpage: Webpage, kwargs: dict = {}):
-        try:
-            webdriver_options = webdriver.FirefoxOptions()
-            webdriver_options.add_argument("--no-shm")
-
-            driver = webdriver.Remote(
-                f"{Settings.selenium_remote_url}/wd/hub",
-                DesiredCapabilities.FIREFOX,
-                options=webdriver_options,
-            )
-            driver.set_page_load_timeout(Settings.browser_timeout)
-            driver.implicitly_wait(Settings.selenium_loading_time)
+        with browser_pool.session() as driver:
+            started = time.monotonic()
             try:
                 driver.get(webpage.url)
-                time.sleep(Settings.selenium_loading_time)
             except TimeoutException:
                 driver.execute_script("window.stop();")
+            loaded = time.monotonic()
+            readiness = wait_until_ready(driver)
+            settled = time.monotonic()
 
-            source_code = get_source_with_iframes(driver)
+            source_code, iframes = get_source_with_iframes(driver)
+            captured = time.monotonic()
             if kwargs.get("extract_images", False):
                 images = browser_img_arr(driver, "image_extractor.js")
             else:
                 images = []
+            finished = time.monotonic()
+            timings = {
+                "navigation": round(loaded - started, 3),
+                "settle": round(settled - loaded, 3),
+                "iframes": round(captured - settled, 3),
+                "capture": round(finished - captured, 3),
+                "total": round(finished - started, 3),
+                "ready": readiness.get("ready", False),
+                "ready_state_ms": readiness.get("ready_state_ms"),
+            }
+            logging.info(f"Browser fetch timings for {webpage.url}: {timings}")
             # favicon_images = browser_img_arr(driver, "favicon.js")
             # logo_images = browser_img_arr(driver, "logo_img.js")
             # screenshot_image = capture_full_page_screenshot(driver)
             return {
                 "source_code": source_code,
                 "images": images,
+                "timings": timings,
+                "iframes": iframes,
                 # "favicon_images": favicon_images,
                 # "logo_images": logo_images,
                 # "screenshot_image": screenshot_image,
             }
-        finally:
-            try:
-                driver.quit()
-            except:
-                pass
 
     try:
-        with ThreadPoolExecutor() as executor:
-            return await asyncio.get_event_loop().run_in_executor(
-                executor, browser_fetch, webpage
-            )
+        return await browser_pool.run(browser_fetch, webpage)
     except Exception as e:
         webpage.task_status = TaskStatusEnum.error
         await webpage.save_report(
@@ -254,107 +337,309 @@ async def get_google_result(url, **kwargs):
 
 @basic.try_except_wrapper
 # @basic.retry_execution(attempts=3, delay=1)
-async def fetch_webpage(webpage: Webpage, **kwargs) -> dict:
+async def fetch_webpage(webpage: Webpage, **kwargs) -> Webpage:
+    """Fetch a webpage once per url across concurrent callers and workers.
+
+    Callers only share a fetch made with the same overrides, so a forced
+    refetch or another crawl method never gets the result of a plain fetch.
+    """
+    key = ":".join(
+        [
+            webpage.canonical_key,
+            "force" if kwargs.get("force_refetch") else "",
+            kwargs.get("crawl_method") or "",
+        ]
+    )
+    return await fetch_flights.do(key, fetch_webpage_leased, webpage, **kwargs)
+
+
+async def fetch_webpage_leased(webpage: Webpage, **kwargs) -> Webpage:
+    lease = RedisLease(
+        f"WEBPAGE:lease:{webpage.canonical_key}",
+        ttl=Settings.fetch_lease_ttl,
+    )
+    acquired = await lease.acquire()
+    for _ in range(FETCH_LEASE_ATTEMPTS):
+        if acquired:
+            break
+        logging.info(f"Waiting for another worker to fetch {webpage.url}")
+        # the other worker may have served the page from cache, so a forced
+        # refetch still fetches once it has the lease
+        await lease.wait(Settings.fetch_lease_ttl)
+        acquired = await lease.acquire()
+    if not acquired:
+        raise TimeoutError(f"Could not get the fetch lease of {webpage.url}")
+
+    try:
+        async with lease.kept_alive():
+            return await fetch_webpage_unshared(webpage, **kwargs)
+    finally:
+        await lease.release()
+
+
+async def fetch_webpage_unshared(webpage: Webpage, **kwargs) -> Webpage:
     webpage = await Webpage.get_by_url(webpage.url)
 
     async with semaphore:
         # Check cache first
-        if webpage.check_cache() and not kwargs.get("force_refetch"):
+        if await webpage.check_cache() and not kwargs.get("force_refetch"):
             logging.info(f"Fetching webpage {webpage.url} from cache")
             webpage.task_status = TaskStatusEnum.completed
-            await webpage.save()
-            return webpage
+            return await finalize_webpage(webpage, source_changed=False)
 
         # browser_task = asyncio.create_task(fetch_webpage_dynamic(webpage))
         # fetch_tasks = [browser_task]
         webpage.task_status = TaskStatusEnum.processing
         await webpage.save()
 
-        # Try network fetch
-        content = await fetch_webpage_direct(webpage, **kwargs)
-        if content and content.get("error") == "not_html":
-            webpage.page_source = "<html><body><h1>Not HTML</h1></body></html>"
-            webpage.task_status = TaskStatusEnum.completed
-            await webpage.save()
-            return webpage
+        domain = get_main_domain(webpage.url)
+        methods = await crawl_methods(domain, kwargs.get("crawl_method"))
+        # a 304 keeps the stored source as is, which is only the raw HTML for
+        # direct pages; rendered and embedded sources are built again
+        conditional = webpage.crawl_method == "direct" and bool(
+            webpage.etag or webpage.last_modified
+        )
+        previous_hash = webpage.source_hash
+        direct = None
+        for method in methods:
+            started = time.monotonic()
+            if method in ("direct", "embedded") and direct is None:
+                direct = (
+                    await fetch_webpage_direct(
+                        webpage, conditional=conditional, **kwargs
+                    )
+                    or {}
+                )
+                if direct.get("not_modified") and await webpage.touch_page_source():
+                    logging.info(f"Webpage {webpage.url} not modified")
+                    webpage.etag = direct.get("etag")
+                    webpage.last_modified = direct.get("last_modified")
+                    webpage.task_status = TaskStatusEnum.completed
+                    return await finalize_webpage(webpage, source_changed=False)
+                if direct.get("not_modified"):
+                    # the source expired in between, fetch it in full
+                    direct = await fetch_webpage_direct(webpage, **kwargs) or {}
+                webpage.etag = direct.get("etag")
+                webpage.last_modified = direct.get("last_modified")
+                if direct.get("error") == "not_html":
+                    await webpage.save_page_source(
+                        "<html><body><h1>Not HTML</h1></body></html>"
+                    )
+                    webpage.crawl_method = method
+                    webpage.task_status = TaskStatusEnum.completed
+                    return await finalize_webpage(
+                        webpage, source_changed=webpage.source_hash != previous_hash
+                    )
 
-        webpage.page_source = content.get("source_code") if content else None
-        if webpage.is_enough_text():
-            webpage.task_status = TaskStatusEnum.completed
-            await webpage.save()
-            logging.info(f"Fetching webpage {webpage.url} from network")
-            return webpage
+            if method == "direct":
+                content = direct
+                timings = {"total": round(time.monotonic() - started, 3)}
+            elif method == "embedded":
+                if not direct.get("source_code"):
+                    # nothing to mine, the direct fetch itself failed
+                    continue
+                source_code = await extraction_engine.run(
+                    with_embedded_content, direct["source_code"]
+                )
+                content = {
+                    "source_code": source_code,
+                    "truncated": direct.get("truncated"),
+                }
+                timings = {"total": round(time.monotonic() - started, 3)}
+            else:
+                content = await fetch_webpage_dynamic(webpage, **kwargs)
+                timings = content.get("timings") if content else None
+
+            if not content or not content.get("source_code"):
+                # keep the source of an earlier tier or fetch
+                await domain_strategies.record(
+                    domain, method, False, time.monotonic() - started
+                )
+                continue
+            if method == "browser":
+                # `images` is left to `images_from_webpage`, which verifies them
+                webpage.iframes = content.get("iframes")
+            await webpage.save_page_source(content["source_code"])
+            webpage.truncated = bool(content.get("truncated"))
+            webpage.crawl_method = method
+            webpage.fetch_timings = timings
+            await webpage.parse()
+            success = webpage.is_enough_text()
+            await domain_strategies.record(
+                domain, method, success, time.monotonic() - started
+            )
+            if success:
+                break
 
-        content: dict = await fetch_webpage_dynamic(webpage, **kwargs)
-        webpage.page_source = content.get("source_code") if content else None
-        webpage.images = content.get("images") if content else None
         webpage.task_status = TaskStatusEnum.completed
-        logging.info(f"Fetching webpage {webpage.url} from browser")
+        logging.info(f"Fetching webpage {webpage.url} with {webpage.crawl_method}")
+        return await finalize_webpage(
+            webpage, source_changed=webpage.source_hash != previous_hash
+        )
 
-        await webpage.save()
-        return webpage
+
+async def crawl_methods(domain: str, forced: str | None = None) -> list[str]:
+    """Methods to try in order: the forced one, or from the learned start tier."""
+    if forced:
+        return [forced]
+    start = await domain_strategies.start_method(domain)
+    return CRAWL_METHODS[CRAWL_METHODS.index(start) :]
+
+
+async def finalize_webpage(webpage: Webpage, *, source_changed=True) -> Webpage:
+    """Extraction stage: persist the derived fields and save the webpage."""
+    if source_changed or webpage.derived_version < DERIVED_FIELDS_VERSION:
+        await webpage.load_page_source()
+        await webpage.parse()
+        webpage.update_derived_fields()
+    await webpage.save()
+    return webpage
+
+
+@basic.try_except_wrapper
+async def backfill_derived_fields(batch_size: int = 100):
+    """Compute derived fields for webpages stored before they were persisted.
+
+    Consumers run meanwhile, so only the derived fields are written and only
+    while the stored document is still outdated.
+    """
+    collection = Webpage.get_motor_collection()
+    while True:
+        webpages = await Webpage.outdated_derived_fields(limit=batch_size)
+        if not webpages:
+            break
+        for webpage in webpages:
+            await webpage.load_page_source()
+            await webpage.parse()
+            webpage.update_derived_fields()
+            result = await collection.update_one(
+                {
+                    "_id": webpage.id,
+                    "$or": [
+                        {"derived_version": {"$exists": False}},
+                        {"derived_version": {"$lt": DERIVED_FIELDS_VERSION}},
+                    ],
+                },
+                {"$set": webpage.model_dump(include=DERIVED_FIELDS)},
+            )
+            if not result.modified_count:
+                logging.info(f"Derived fields of {webpage.url} were updated meanwhile")
+        logging.info(f"Backfilled derived fields for {len(webpages)} webpages")
 
 
 @basic.try_except_wrapper
 async def language_validation(
-    soup: BeautifulSoup, invalid_languages: list[str] = ["fa"]
+    webpage: Webpage, invalid_languages: list[str] = ["fa"], threshold: float = 20.0
 ) -> bool:
-    # Extract all text from the soup
-    if not soup:
-        return True
-    full_text = soup.get_text(strip=True)
-
-    # If there's not enough text to analyze, consider it valid
-    if len(full_text) < 100:
-        return True
-
-    # Split text into chunks for better language detection
-    chunk_size = 500  # Characters per chunk
-    chunks = [
-        full_text[i : i + chunk_size] for i in range(0, len(full_text), chunk_size)
-    ]
+    """Check the language shares of the page, detecting them once per content.
+
+    The full sampled distribution is stored on the webpage and each call
+    decides against its own `invalid_languages` and `threshold`.
+    """
+    if webpage.languages is None:
+        text = webpage.text
+        # If there's not enough text to analyze, consider it valid
+        if len(text) < 100:
+            return True
+        webpage.languages = await extraction_engine.run(
+            detect_languages, text, max_samples=Settings.language_max_samples
+        )
+    return is_valid_language(webpage.languages, invalid_languages, threshold)
+
+
+async def probe_image(
+    client: httpx.AsyncClient, image_url: str, headers: dict, max_bytes: int
+) -> tuple[dict | None, httpx.Response]:
+    """Stream the image until its size is known or `max_bytes` were read."""
+    async with client.stream("GET", image_url, headers=headers) as response:
+        response.raise_for_status()
+        data = bytearray()
+        parser = ImageFile.Parser()
+        size = None
+        async for chunk in response.aiter_bytes():
+            data.extend(chunk)
+            size = get_image_size(data)
+            if size is None and image_format(data[:16]) is None:
+                # unknown format, let PIL decode what it needs
+                parser.feed(chunk)
+                size = parser.image.size if parser.image else None
+            if size is not None or len(data) >= max_bytes:
+                break
+    if size is None:
+        return None, response
+
+    content_range = response.headers.get("Content-Range", "")
+    content_length = (
+        content_range.rpartition("/")[2]
+        if response.status_code == 206
+        else response.headers.get("Content-Length")
+    )
+    return {
+        "width": size[0],
+        "height": size[1],
+        "content_type": response.headers.get("Content-Type"),
+        "content_length": (
+            int(content_length) if content_length and content_length.isdigit() else None
+        ),
+    }, response
+
+
+async def get_image_metadata(image_url: str) -> dict | None:
+    """Read image dimensions from the image header with the shared client.
+
+    The first `image_probe_bytes` are requested with a Range header; if the
+    header is longer, the image is streamed again and read only until its
+    size is known.
+    """
+    if image_url.startswith("data:image"):
+        image = imagetools.load_from_base64(image_url)
+        return {"width": image.width, "height": image.height}
+
+    client = http_client.get_client()
+    probe_bytes = Settings.image_probe_bytes
+    max_bytes = Settings.image_probe_max_bytes
+    async with http_client.host_slot(image_url):
+        metadata, response = await probe_image(
+            client, image_url, {"Range": f"bytes=0-{probe_bytes - 1}"}, max_bytes
+        )
+        if metadata is None and response.status_code == 206:
+            metadata, response = await probe_image(client, image_url, {}, max_bytes)
+    if metadata is None:
+        raise ValueError("Could not determine image dimensions")
+    return metadata
 
-    # Detect language for each chunk
-    language_counts = {}
-    for chunk in chunks:
-        # Skip chunks that are too short for reliable detection
-        if len(chunk.strip()) < 50:
-            continue
 
-        try:
-            lang = langdetect.detect(chunk)
-            language_counts[lang] = language_counts.get(lang, 0) + 1
-        except langdetect.LangDetectException:
-            # Skip chunks where language detection fails
-            continue
-
-    # If no languages were detected, consider it valid
-    if not language_counts:
-        return True
-
-    # Calculate percentage of each language
-    total_chunks = sum(language_counts.values())
-    language_percentages = {
-        lang: (count / total_chunks) * 100 for lang, count in language_counts.items()
-    }
+async def get_cached_image_metadata(image_url: str) -> dict | None:
+    """Image metadata from the shared cache, fetched and cached on a miss.
 
-    # Check if any invalid language exceeds threshold (e.g., 20%)
-    threshold = 20.0
-    for invalid_lang in invalid_languages:
-        if language_percentages.get(invalid_lang, 0) > threshold:
-            return False
+    Missing, forbidden and unreadable images are cached too, with an error
+    `status`; transient errors are raised and not cached.
+    """
+    if image_url.startswith("data:image"):
+        return await get_image_metadata(image_url)
 
-    return True
+    metadata = await image_cache.get(image_url)
+    if metadata is not None:
+        return metadata
+    try:
+        metadata = await get_image_metadata(image_url) | {"status": 200}
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code not in (403, 404, 410):
+            raise
+        metadata = {"status": e.response.status_code}
+    except (binascii.Error, OSError, ValueError) as e:
+        # OSError covers PIL failing on truncated or corrupt data
+        logging.error(f"Error downloading image {image_url}: {type(e)} {e}")
+        metadata = {"status": 0}
+    return await image_cache.set(image_url, metadata)
 
 
 async def get_image_verification(
     image_url: str, min_acceptable_side=600, max_acceptable_side=2500
 ) -> dict:
     try:
-        img_response = await imagetools.get_image_metadata(
-            image_url, with_exif=False, follow_redirects=True
-        )
-        if not img_response:
+        img_response = await get_cached_image_metadata(image_url)
+        if not img_response or img_response.get("status", 200) != 200:
             return False
         width, height = img_response.get("width"), img_response.get("height")
         longer_side, shorter_side = max(width, height), min(width, height)
@@ -365,7 +650,7 @@ async def get_image_verification(
         ):
             return True
 
-    except (binascii.Error, Image.UnidentifiedImageError, ValueError) as e:
+    except (binascii.Error, OSError, ValueError) as e:
         logging.error(f"Error downloading image {image_url}: {type(e)} {e}")
     except httpx.HTTPError as e:
         if hasattr(e, "response") and (
@@ -376,42 +661,6 @@ async def get_image_verification(
     return False
 
 
-def is_valid_image_url(img_url: str, base_url: str, check_svg: bool = True) -> bool:
-    full_url = urljoin(base_url, img_url)
-    return (
-        full_url
-        and full_url != base_url
-        and (full_url.startswith("data:image/") or validators.url(full_url))
-        and not (
-            check_svg
-            and (full_url.endswith(".svg") or "data:image/svg+xml" in full_url)
-        )
-    )
-
-
-def extract_image_urls(
-    soup: BeautifulSoup, base_url: str, html_source: str
-) -> set[str]:
-    def join_url(url: str) -> str:
-        if url.startswith("https:/") and not url.startswith("https://"):
-            url = url.replace("https:/", "https://", 1)
-        return urljoin(base_url, url)
-
-    urls = set()
-    for img in soup.find_all("img"):
-        src = img.get("src")
-        if src:
-            urls.add(join_url(src))
-        srcset = img.get("srcset")
-        if srcset:
-            # Adjust splitting as needed: some srcset values are comma separated.
-            for part in re.split(r",\s*", srcset):
-                url_part = (part.split() or [part])[0]
-                urls.add(join_url(url_part))
-    urls.update(join_url(img_url) for img_url in image_url_pattern.findall(html_source))
-    return urls
-
-
 async def images_from_webpage(
     webpage: Webpage,
     *,
@@ -420,24 +669,35 @@ async def images_from_webpage(
     max_acceptable_side=2500,
     with_svg: bool = False,
 ):
-    if webpage.images:
+    options = {
+        "invalid_languages": invalid_languages,
+        "min_acceptable_side": min_acceptable_side,
+        "max_acceptable_side": max_acceptable_side,
+        "with_svg": with_svg,
+    }
+    if webpage.images is not None and webpage.images_unchanged(options):
+        logging.info(f"Reusing images of unchanged {webpage.url}")
         return webpage.images
 
     url = webpage.url
-    html_source = webpage.page_source
-    soup = webpage.soup
+    await webpage.load_page_source()
+    # one pass in the extraction engine gives the text and the ranked candidates
+    document = await webpage.parse(
+        image_options={
+            "min_side": min_acceptable_side,
+            "max_side": max_acceptable_side,
+            "limit": Settings.image_max_candidates,
+            "with_svg": with_svg,
+        }
+    )
+    if document is None:
+        return []
 
-    if not await language_validation(soup, invalid_languages=invalid_languages):
+    if not await language_validation(webpage, invalid_languages=invalid_languages):
         logging.warning(f"Skipping {url} as its language is Persian.")
         return []
 
-    # Extract and filter candidate image URLs.
-    all_urls = extract_image_urls(soup, url, html_source)
-    candidate_image_urls = {
-        img_url
-        for img_url in all_urls
-        if is_valid_image_url(img_url, url, not with_svg)
-    }
+    candidate_image_urls = document.image_candidates
 
     async def limited_verification(image_url: str) -> bool:
         async with image_limit_semaphore:
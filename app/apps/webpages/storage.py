@@ -0,0 +1,465 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import mmap
+import os
+import time
+import uuid
+from pathlib import Path
+
+from server.config import Settings
+from utils.cache import LRUCache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed values start with a NUL byte, which never begins the utf-8 HTML
+# stored by older versions, so legacy values are still read as plain text.
+ZSTD_HEADER = b"\x00ZS1"
+GZIP_HEADER = b"\x00GZ1"
+HEADER_SIZE = 4
+
+# Sources larger than this are (de)compressed off the event loop
+THREAD_THRESHOLD = 256 * 1024
+
+
+def compress_source(source: str, compression: str | None = None) -> bytes:
+    if compression is None:
+        compression = Settings.source_compression
+    data = source.encode("utf-8")
+    if compression == "zstd" and zstandard is not None:
+        return ZSTD_HEADER + zstandard.ZstdCompressor(level=3).compress(data)
+    if compression in ("zstd", "gzip"):
+        return GZIP_HEADER + gzip.compress(data, compresslevel=6)
+    return data
+
+
+def decompress_source(value: bytes) -> str:
+    header = value[:HEADER_SIZE]
+    if header == ZSTD_HEADER:
+        if zstandard is None:
+            raise ValueError("zstandard is required to read this page source")
+        data = zstandard.ZstdDecompressor().decompress(value[HEADER_SIZE:])
+    elif header == GZIP_HEADER:
+        data = gzip.decompress(value[HEADER_SIZE:])
+    else:
+        data = value
+    return data.decode("utf-8", errors="replace")
+
+
+async def encode(source: str) -> bytes:
+    if len(source) > THREAD_THRESHOLD:
+        return await asyncio.to_thread(compress_source, source)
+    return compress_source(source)
+
+
+async def decode(value: bytes) -> str:
+    if len(value) > THREAD_THRESHOLD:
+        return await asyncio.to_thread(decompress_source, value)
+    return decompress_source(value)
+
+
+class SourceBackend:
+    """A storage tier holding encoded page sources by url."""
+
+    name: str = "backend"
+
+    def __init__(self, ttl: int):
+        self.default_ttl = ttl
+
+    async def get(self, url: str) -> bytes | None:
+        raise NotImplementedError
+
+    async def set(self, url: str, value: bytes, ttl: int | None = None):
+        raise NotImplementedError
+
+    async def ttl(self, url: str) -> int | None:
+        """Remaining seconds to live, or None if the source is not stored."""
+        raise NotImplementedError
+
+    async def delete(self, url: str):
+        raise NotImplementedError
+
+    async def touch(self, url: str, ttl: int | None = None) -> bool:
+        """Restart the time to live of a stored source; False if it is missing."""
+        raise NotImplementedError
+
+    async def exists(self, url: str) -> bool:
+        return await self.ttl(url) is not None
+
+    async def exists_many(self, urls: list[str]) -> list[bool]:
+        return list(await asyncio.gather(*[self.exists(url) for url in urls]))
+
+    async def get_many(self, urls: list[str]) -> list[bytes | None]:
+        return list(await asyncio.gather(*[self.get(url) for url in urls]))
+
+
+class MemorySourceBackend(SourceBackend):
+    name = "memory"
+
+    def __init__(self, ttl: int, max_items: int, max_bytes: int):
+        super().__init__(ttl)
+        self.cache = LRUCache(max_items, max_size=max_bytes, ttl=ttl, sizeof=len)
+
+    async def get(self, url: str) -> bytes | None:
+        return self.cache.get(url)
+
+    async def set(self, url: str, value: bytes, ttl: int | None = None):
+        self.cache.set(url, value, ttl=ttl or self.default_ttl)
+
+    async def ttl(self, url: str) -> int | None:
+        if self.cache.get(url) is None:
+            return None
+        return int(self.cache.ttl_of(url) or 0)
+
+    async def delete(self, url: str):
+        self.cache.pop(url)
+
+    async def touch(self, url: str, ttl: int | None = None) -> bool:
+        value = self.cache.get(url)
+        if value is None:
+            return False
+        self.cache.set(url, value, ttl=ttl or self.default_ttl)
+        return True
+
+
+class RedisSourceBackend(SourceBackend):
+    name = "redis"
+    key_prefix = "WEBPAGE:source:"
+
+    def __init__(self, ttl: int, redis=None):
+        super().__init__(ttl)
+        self._redis = redis
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            from server.db import redis
+
+            self._redis = redis
+        return self._redis
+
+    def key(self, url: str) -> str:
+        return f"{self.key_prefix}{url}"
+
+    async def get(self, url: str) -> bytes | None:
+        return await self.redis.get(self.key(url))
+
+    async def set(self, url: str, value: bytes, ttl: int | None = None):
+        await self.redis.set(self.key(url), value, ex=ttl or self.default_ttl)
+
+    async def ttl(self, url: str) -> int | None:
+        ttl = await self.redis.ttl(self.key(url))
+        if ttl == -2:
+            return None
+        return ttl
+
+    async def delete(self, url: str):
+        await self.redis.delete(self.key(url))
+
+    async def get_many(self, urls: list[str]) -> list[bytes | None]:
+        if not urls:
+            return []
+        return await self.redis.mget([self.key(url) for url in urls])
+
+    async def exists_many(self, urls: list[str]) -> list[bool]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for url in urls:
+                pipe.exists(self.key(url))
+            return [bool(found) for found in await pipe.execute()]
+
+    async def touch(self, url: str, ttl: int | None = None) -> bool:
+        return bool(await self.redis.expire(self.key(url), ttl or self.default_ttl))
+
+
+class FileSystemSourceBackend(SourceBackend):
+    """Content-addressed cold tier on the local filesystem.
+
+    Encoded sources live in `objects/<hash>` and are read through mmap; each url
+    has a small index file in `urls/` naming its object, whose mtime is set to
+    the expiry time.
+    """
+
+    name = "disk"
+
+    def __init__(self, ttl: int, directory: Path):
+        super().__init__(ttl)
+        self.directory = Path(directory)
+
+    def _index_path(self, url: str) -> Path:
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return self.directory / "urls" / digest[:2] / digest
+
+    def _object_path(self, digest: str) -> Path:
+        return self.directory / "objects" / digest[:2] / digest
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _read_index(self, url: str) -> tuple[str, float] | None:
+        index_path = self._index_path(url)
+        try:
+            expires_at = float(index_path.stat().st_mtime)
+            digest = index_path.read_text().strip()
+        except FileNotFoundError:
+            return None
+        if expires_at <= time.time():
+            index_path.unlink(missing_ok=True)
+            return None
+        return digest, expires_at
+
+    def _get(self, url: str) -> bytes | None:
+        index = self._read_index(url)
+        if index is None:
+            return None
+        try:
+            with open(self._object_path(index[0]), "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return bytes(mapped)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _set(self, url: str, value: bytes, ttl: int):
+        digest = hashlib.sha256(value).hexdigest()
+        object_path = self._object_path(digest)
+        if not object_path.exists():
+            self._write_atomic(object_path, value)
+        index_path = self._index_path(url)
+        self._write_atomic(index_path, digest.encode())
+        expires_at = time.time() + ttl
+        os.utime(index_path, (expires_at, expires_at))
+
+    def _touch(self, url: str, ttl: int) -> bool:
+        if self._read_index(url) is None:
+            return False
+        expires_at = time.time() + ttl
+        try:
+            os.utime(self._index_path(url), (expires_at, expires_at))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _ttl(self, url: str) -> int | None:
+        index = self._read_index(url)
+        if index is None:
+            return None
+        return int(index[1] - time.time())
+
+    async def get(self, url: str) -> bytes | None:
+        return await asyncio.to_thread(self._get, url)
+
+    async def set(self, url: str, value: bytes, ttl: int | None = None):
+        await asyncio.to_thread(self._set, url, value, ttl or self.default_ttl)
+
+    async def ttl(self, url: str) -> int | None:
+        return await asyncio.to_thread(self._ttl, url)
+
+    async def delete(self, url: str):
+        await asyncio.to_thread(self._index_path(url).unlink, missing_ok=True)
+
+    async def touch(self, url: str, ttl: int | None = None) -> bool:
+        return await asyncio.to_thread(self._touch, url, ttl or self.default_ttl)
+
+    def prune(self) -> int:
+        """Remove expired index files and objects no url points to."""
+        now = time.time()
+        referenced = set()
+        for index_path in (self.directory / "urls").glob("*/*"):
+            try:
+                if index_path.stat().st_mtime <= now:
+                    index_path.unlink(missing_ok=True)
+                    continue
+                referenced.add(index_path.read_text().strip())
+            except FileNotFoundError:
+                continue
+        removed = 0
+        for object_path in (self.directory / "objects").glob("*/*"):
+            if object_path.name.startswith(".") or object_path.name in referenced:
+                continue
+            object_path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+
+class SourceStore:
+    """Tiered page source storage, fastest tier first.
+
+    Writes go through to every tier. A read is served by the first tier that
+    has the source and promotes it into the faster tiers, so sources expired
+    from memory or redis are still served from the colder tiers.
+    """
+
+    def __init__(self, tiers: list[SourceBackend]):
+        self.tiers = tiers
+
+    @classmethod
+    def from_settings(cls) -> "SourceStore":
+        tiers = []
+        for name in Settings.source_tiers.split(","):
+            match name.strip():
+                case "memory":
+                    tiers.append(
+                        MemorySourceBackend(
+                            Settings.source_memory_ttl,
+                            Settings.source_memory_items,
+                            Settings.source_memory_bytes,
+                        )
+                    )
+                case "redis":
+                    tiers.append(RedisSourceBackend(Settings.source_ttl))
+                case "disk":
+                    tiers.append(
+                        FileSystemSourceBackend(
+                            Settings.source_disk_ttl, Settings.source_disk_dir
+                        )
+                    )
+                case "":
+                    continue
+                case other:
+                    raise ValueError(f"Unknown page source tier `{other}`")
+        return cls(tiers)
+
+    async def _get_raw(self, url: str) -> bytes | None:
+        for i, tier in enumerate(self.tiers):
+            try:
+                value = await tier.get(url)
+            except Exception as e:
+                logging.error(f"Error reading `{url}` from {tier.name}: {type(e)} {e}")
+                continue
+            if value is None:
+                continue
+            if i > 0:
+                await self._promote(url, value, self.tiers[:i], tier)
+            return value
+        return None
+
+    async def _promote(
+        self, url: str, value: bytes, tiers: list[SourceBackend], source: SourceBackend
+    ):
+        remaining = await source.ttl(url)
+        for tier in tiers:
+            ttl = tier.default_ttl
+            if remaining:
+                ttl = min(ttl, remaining)
+            try:
+                await tier.set(url, value, ttl)
+            except Exception as e:
+                logging.error(f"Error promoting `{url}` to {tier.name}: {type(e)} {e}")
+
+    async def get(self, url: str) -> str | None:
+        value = await self._get_raw(url)
+        if value is None:
+            return None
+        try:
+            return await decode(value)
+        except Exception as e:
+            logging.error(f"Error decoding page source of `{url}`: {type(e)} {e}")
+            return None
+
+    async def _on_tiers(self, action: str, url: str, calls) -> list:
+        """Await one call per tier; a failing tier is logged, not raised."""
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for tier, result in zip(self.tiers, results):
+            if isinstance(result, Exception):
+                logging.error(
+                    f"Error {action} `{url}` in {tier.name}: {type(result)} {result}"
+                )
+        return results
+
+    async def set(self, url: str, source: str, ttl: int | None = None):
+        value = await encode(source)
+        results = await self._on_tiers(
+            "writing", url, [tier.set(url, value, ttl) for tier in self.tiers]
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+
+    async def exists(self, url: str) -> bool:
+        found = await self._on_tiers(
+            "checking", url, [tier.exists(url) for tier in self.tiers]
+        )
+        return any(result is True for result in found)
+
+    async def get_many(self, urls: list[str]) -> list[str | None]:
+        """Sources of `urls` in order, asking each tier only once.
+
+        Unlike `get`, sources are not promoted into the faster tiers, so a bulk
+        read does not push the working set out of memory.
+        """
+        values: list[bytes | None] = [None] * len(urls)
+        for tier in self.tiers:
+            missing = [i for i, value in enumerate(values) if value is None]
+            if not missing:
+                break
+            try:
+                found = await tier.get_many([urls[i] for i in missing])
+            except Exception as e:
+                logging.error(f"Error reading sources from {tier.name}: {type(e)} {e}")
+                continue
+            for i, value in zip(missing, found):
+                values[i] = value
+
+        sources: list[str | None] = []
+        for url, value in zip(urls, values):
+            if value is None:
+                sources.append(None)
+                continue
+            try:
+                sources.append(await decode(value))
+            except Exception as e:
+                logging.error(f"Error decoding page source of `{url}`: {type(e)} {e}")
+                sources.append(None)
+        return sources
+
+    async def exists_many(self, urls: list[str]) -> list[bool]:
+        """Whether each url has a stored source, asking each tier only once."""
+        found = [False] * len(urls)
+        for tier in self.tiers:
+            missing = [i for i, exists in enumerate(found) if not exists]
+            if not missing:
+                break
+            try:
+                results = await tier.exists_many([urls[i] for i in missing])
+            except Exception as e:
+                logging.error(f"Error checking sources in {tier.name}: {type(e)} {e}")
+                continue
+            for i, exists in zip(missing, results):
+                found[i] = exists
+        return found
+
+    async def ttl(self, url: str) -> int | None:
+        """Longest remaining time to live over all tiers."""
+        ttls = await self._on_tiers(
+            "checking", url, [tier.ttl(url) for tier in self.tiers]
+        )
+        ttls = [ttl for ttl in ttls if isinstance(ttl, int)]
+        return max(ttls) if ttls else None
+
+    async def delete(self, url: str):
+        await self._on_tiers(
+            "deleting", url, [tier.delete(url) for tier in self.tiers]
+        )
+
+    async def touch(self, url: str) -> bool:
+        """Restart the time to live of the source in every tier that holds it."""
+        touched = await self._on_tiers(
+            "touching", url, [tier.touch(url) for tier in self.tiers]
+        )
+        return any(result is True for result in touched)
+
+    async def prune(self):
+        for tier in self.tiers:
+            if isinstance(tier, FileSystemSourceBackend):
+                removed = await asyncio.to_thread(tier.prune)
+                logging.info(f"Pruned {removed} page sources from {tier.name}")
+
+
+source_store = SourceStore.from_settings()
@@ -0,0 +1,113 @@
+import dataclasses
+import logging
+import random
+
+from redis.asyncio.client import Redis
+from server.config import Settings
+
+# cheapest first; "embedded" mines the direct fetch, so both share one request
+CRAWL_METHODS = ["direct", "embedded", "browser"]
+
+
+@dataclasses.dataclass
+class MethodStats:
+    attempts: int = 0
+    successes: int = 0
+    latency: float = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.attempts if self.attempts else 0.0
+
+    @property
+    def average_latency(self) -> float:
+        return self.latency / self.attempts if self.attempts else 0.0
+
+
+def choose_method(
+    stats: dict[str, MethodStats],
+    methods: list[str] = CRAWL_METHODS,
+    *,
+    min_samples: int = 5,
+    min_success_rate: float = 0.2,
+) -> str:
+    """Pick the cheapest method that is not known to fail for the domain.
+
+    A method with fewer than `min_samples` attempts is tried, since nothing
+    is known about it yet; the last method is the fallback.
+    """
+    for method in methods[:-1]:
+        method_stats = stats.get(method, MethodStats())
+        if method_stats.attempts < min_samples:
+            return method
+        if method_stats.success_rate >= min_success_rate:
+            return method
+    return methods[-1]
+
+
+class DomainStrategyStore:
+    """Per-domain success counts and latencies of each crawl method in Redis.
+
+    Each domain is a hash with `<method>:attempts`, `<method>:successes` and
+    `<method>:latency` (total seconds) fields that expires when not updated.
+    """
+
+    def __init__(self, redis: Redis | None = None):
+        self._redis = redis
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            from server.db import redis
+
+            self._redis = redis
+        return self._redis
+
+    @staticmethod
+    def key(domain: str) -> str:
+        return f"WEBPAGE:strategy:{domain}"
+
+    async def stats(self, domain: str) -> dict[str, MethodStats]:
+        stats: dict[str, MethodStats] = {}
+        for field, value in (await self.redis.hgetall(self.key(domain))).items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            method, _, name = field.partition(":")
+            method_stats = stats.setdefault(method, MethodStats())
+            if name == "latency":
+                method_stats.latency = float(value)
+            elif name in ("attempts", "successes"):
+                setattr(method_stats, name, int(value))
+        return stats
+
+    async def start_method(self, domain: str, methods: list[str] = CRAWL_METHODS) -> str:
+        try:
+            stats = await self.stats(domain)
+        except Exception as e:
+            logging.warning(f"Could not read crawl strategy for {domain}: {e}")
+            return methods[0]
+        method = choose_method(
+            stats,
+            methods,
+            min_samples=Settings.strategy_min_samples,
+            min_success_rate=Settings.strategy_min_success_rate,
+        )
+        # now and then retry the cheap method so a domain can be relearned
+        if method != methods[0] and random.random() < Settings.strategy_explore_rate:
+            return methods[0]
+        return method
+
+    async def record(self, domain: str, method: str, success: bool, latency: float):
+        key = self.key(domain)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hincrby(key, f"{method}:attempts", 1)
+                pipe.hincrby(key, f"{method}:successes", int(success))
+                pipe.hincrbyfloat(key, f"{method}:latency", latency)
+                pipe.expire(key, Settings.strategy_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logging.warning(f"Could not record crawl strategy for {domain}: {e}")
+
+
+domain_strategies = DomainStrategyStore()
@@ -0,0 +1,60 @@
+"""Export crawled webpages as newline delimited JSON.
+
+    python export.py --status completed --domain example.com -o pages.ndjson
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime
+
+from apps.webpages.export import export_query, export_records, ndjson_lines
+from apps.webpages.extraction import extraction_engine
+from server import config
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user-id", help="only webpages of this user")
+    parser.add_argument("--status", help="task status, e.g. completed")
+    parser.add_argument("--domain", help="main domain, e.g. example.com")
+    parser.add_argument("--updated-from", type=datetime.fromisoformat)
+    parser.add_argument("--updated-to", type=datetime.fromisoformat)
+    parser.add_argument("--no-text", action="store_true", help="skip page text")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("-o", "--output", help="output file, stdout by default")
+    return parser.parse_args(argv)
+
+
+async def export(args):
+    from fastapi_mongo_base.core import db
+
+    config.Settings.config_logger()
+    await db.init_mongo_db()
+
+    query = export_query(
+        args.user_id,
+        status=args.status,
+        domain=args.domain,
+        updated_at_from=args.updated_from,
+        updated_at_to=args.updated_to,
+    )
+    records = export_records(
+        query, with_text=not args.no_text, batch_size=args.batch_size
+    )
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    count = 0
+    try:
+        async for line in ndjson_lines(records):
+            output.write(line)
+            count += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        extraction_engine.close()
+    logging.info(f"Exported {count} webpages")
+
+
+if __name__ == "__main__":
+    asyncio.run(export(parse_args()))
@@ -4,10 +4,12 @@ import os
 import signal
 from typing import Type, TypeVar
 
-import json_advanced as json
 from apps.webpages import models
 from fastapi_mongo_base.models import BaseEntityTaskMixin
+from fastapi_mongo_base.tasks import TaskStatusEnum
 from server import config, db
+from server.http_client import http_client
+from server.queue import BULK, QueueMessage, ReliableQueue
 
 T = TypeVar("T", bound=BaseEntityTaskMixin)
 
@@ -19,94 +21,267 @@ async def initialize_app():
 
     config.Settings.config_logger()  # f"{worker_id}.log")
     await db.init_mongo_db()
+    http_client.get_client()
     logging.info("Worker initialized")
 
 
-async def process_queue_message(entity_class: Type[T], **kwargs):
-    queue_name = kwargs.get("name", entity_class.__name__).lower() + "_queue"
-    redis_client = await db.RedisSSHHandler().initialize()
-    await asyncio.wait_for(redis_client.ping(), timeout=10)
-    # logging.info(f"Connected to Redis")
-    result = await redis_client.brpop(queue_name, timeout=300)  # 5 minutes timeout
-    queue_len = await redis_client.llen(queue_name)
-    logging.info(f"Received message from {result} {queue_name} {queue_len}")
-    if result:
-        _, message = result  # Unpack the queue_name and message
-        data = json.loads(message.decode("utf-8"))
-        uid = data.get("uid")
-        entity = await entity_class.get_item(uid)
-        if not entity:
-            return False
-        
-        extract_images = data.get("meta_data", {}).get("extract_images", True)
-        # async with httpx.AsyncClient(
-        #     headers={"x-api-key": os.getenv("UFILES_API_KEY")}
-        # ) as client:
-        #     uid = data.get("uid")
-        #     response = await client.get(
-        #         url=f"https://{config.Settings.root_url}{config.Settings.base_path}/webpages/{uid}",
-        #     )
-        #     if response.status_code == 200:
-        #         entity = entity_class(**response.json())
-        #         await entity.start_processing()
-        #         return True
-
-        logging.info(f"Starting processing for {entity.url}")
-        entity = await entity.start_processing(**data)
+def parse_weights(value: str) -> dict[str, int]:
+    """`interactive:8,bulk:1` -> {"interactive": 8, "bulk": 1}"""
+    weights = {}
+    for item in value.split(","):
+        priority, _, weight = item.strip().partition(":")
+        if priority:
+            weights[priority] = max(1, int(weight or 1))
+    return weights
 
-        logging.info(f"source gotten for {entity.url}")
-
-        if extract_images:
-            from apps.webpages import services
-
-            urls = await services.images_from_webpage(
-                entity,
-                invalid_languages=data.get("meta_data", {}).get(
-                    "invalid_languages", ["fa"]
-                ),
-                min_acceptable_side=data.get("meta_data", {}).get(
-                    "min_acceptable_side", 600
-                ),
-                max_acceptable_side=data.get("meta_data", {}).get(
-                    "max_acceptable_side", 2500
-                ),
-                with_svg=data.get("meta_data", {}).get("with_svg", False),
-            )
-            entity.images = urls
-            await entity.save()
-            logging.info(f"Extracted {len(urls)} images for {entity.url}")
-    return False
 
+class LaneScheduler:
+    """Picks the queue lane each consumer serves next.
 
-async def start_workers():
-    """Start the worker processes"""
-    await initialize_app()
+    Priorities with queued work share the pops by smooth weighted round-robin,
+    so with weights 8:1 interactive work gets eight pops for each bulk one
+    while both have work, and every pop while bulk has none. Within a priority
+    the tenants take turns, so a large crawl only delays its own tenant.
+    """
+
+    def __init__(self, queue: ReliableQueue, weights: dict[str, int] | None = None):
+        self.queue = queue
+        self.weights = weights or parse_weights(config.Settings.queue_priority_weights)
+        self.credits: dict[str, int] = {}
+        self.turns: dict[str, int] = {}
+
+    def priority_order(self, active: list[str]) -> list[str]:
+        """Priorities to try, the one whose turn it is first."""
+        weights = {priority: self.weights.get(priority, 1) for priority in active}
+        for priority, weight in weights.items():
+            self.credits[priority] = self.credits.get(priority, 0) + weight
+        # ties go to the heavier priority
+        chosen = max(active, key=lambda p: (self.credits[p], weights[p]))
+        self.credits[chosen] -= sum(weights.values())
+        rest = sorted(set(active) - {chosen}, key=lambda priority: -weights[priority])
+        return [chosen, *rest]
+
+    def lane_order(self, priority: str, lanes: list) -> list:
+        """Lanes of a priority to try, starting one past the last one served."""
+        start = self.turns.get(priority, 0) % len(lanes)
+        return lanes[start:] + lanes[:start]
+
+    def served(self, priority: str, lanes: list, lane):
+        self.turns[priority] = lanes.index(lane) + 1
+
+    async def next_message(self) -> QueueMessage | None:
+        """Pop from the lanes in scheduling order, in one round trip."""
+        lanes: dict[str, list[str | None]] = {}
+        for lane in await self.queue.lanes():
+            lanes.setdefault(lane.partition(":")[0], []).append(lane)
+        # the plain list holds messages pushed before lanes were introduced
+        lanes.setdefault(BULK, []).append(None)
+
+        order = [
+            lane
+            for priority in self.priority_order(list(lanes))
+            for lane in self.lane_order(priority, lanes[priority])
+        ]
+        message = await self.queue.pop_first(order)
+        if message is not None:
+            priority = message.lane.partition(":")[0] if message.lane else BULK
+            if message.lane in lanes.get(priority, []):
+                self.served(priority, lanes[priority], message.lane)
+        return message
+
+    async def pop(self, timeout: float) -> QueueMessage | None:
+        """The next message, blocking until a push wakes the consumer."""
+        message = await self.next_message()
+        if message is None and await self.queue.wait(timeout):
+            message = await self.next_message()
+        return message
 
+
+async def process_queue_message(
+    entity_class: Type[T], queue: ReliableQueue, scheduler: LaneScheduler
+):
+    message = await scheduler.pop(timeout=config.Settings.worker_poll_timeout)
+    if not message:
+        return False
+
+    logging.info(f"Received message {message.id} from {queue.name}")
+    try:
+        async with queue.kept_in_flight(message):
+            await process_message(entity_class, message.payload)
+    except Exception as e:
+        logging.error(f"Error processing message {message.id}: {type(e)} {e}")
+        if not await queue.nack(message):
+            await mark_failed(entity_class, message)
+        return True
+    await queue.ack(message)
+    return True
+
+
+async def mark_failed(entity_class: Type[T], message: QueueMessage):
+    """Finish the task of a dead-lettered message so clients stop polling it."""
+    entity = await entity_class.get_item(message.payload.get("uid"))
+    if not entity:
+        return
+    entity.task_status = TaskStatusEnum.error
+    await entity.save_report(
+        f"Gave up after {message.attempts + 1} attempts",
+        emit=False,
+        log_type="queue_error",
+    )
+    await entity.save()
+
+
+async def reap_stale_messages(entity_class: Type[T], queue: ReliableQueue):
     while True:
+        await asyncio.sleep(config.Settings.queue_reaper_interval)
+        try:
+            await queue.heartbeat()
+            for message in await queue.requeue_stale() + await queue.recover():
+                await mark_failed(entity_class, message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error requeueing stale messages: {type(e)} {e}")
+
+
+async def process_message(entity_class: Type[T], data: dict):
+    uid = data.get("uid")
+    entity = await entity_class.get_item(uid)
+    if not entity:
+        return False
+
+    extract_images = data.get("meta_data", {}).get("extract_images", True)
+    # async with httpx.AsyncClient(
+    #     headers={"x-api-key": os.getenv("UFILES_API_KEY")}
+    # ) as client:
+    #     uid = data.get("uid")
+    #     response = await client.get(
+    #         url=f"https://{config.Settings.root_url}{config.Settings.base_path}/webpages/{uid}",
+    #     )
+    #     if response.status_code == 200:
+    #         entity = entity_class(**response.json())
+    #         await entity.start_processing()
+    #         return True
+
+    logging.info(f"Starting processing for {entity.url}")
+    # duplicate requests may have asked for a forced refetch or crawl method
+    data = data | await entity.pop_queued_overrides()
+    queued_entity = entity
+    try:
+        entity = await entity.start_processing(**data)
+    finally:
+        await queued_entity.release_queued()
+    if not entity:
+        raise ValueError(f"Fetching {queued_entity.url} failed")
+
+    logging.info(f"source gotten for {entity.url}")
+
+    if extract_images:
+        from apps.webpages import services
+
+        image_options = {
+            "invalid_languages": data.get("meta_data", {}).get(
+                "invalid_languages", ["fa"]
+            ),
+            "min_acceptable_side": data.get("meta_data", {}).get(
+                "min_acceptable_side", 600
+            ),
+            "max_acceptable_side": data.get("meta_data", {}).get(
+                "max_acceptable_side", 2500
+            ),
+            "with_svg": data.get("meta_data", {}).get("with_svg", False),
+        }
+        urls = await services.images_from_webpage(entity, **image_options)
+        entity.images = urls
+        # the key must be built from the same options `images_from_webpage` checks
+        entity.images_hash = entity.images_key(image_options)
+        await entity.save()
+        logging.info(f"Extracted {len(urls)} images for {entity.url}")
+    return True
+
+
+async def consume(
+    index: int,
+    entity_class: Type[T],
+    queue: ReliableQueue,
+    scheduler: LaneScheduler,
+    stop: asyncio.Event,
+):
+    """Process messages one at a time until `stop` is set."""
+    while not stop.is_set():
         try:
-            success = await process_queue_message(
-                entity_class=models.Webpage,
-                name=models.Webpage.__name__,
+            await process_queue_message(
+                entity_class=entity_class, queue=queue, scheduler=scheduler
             )
-            if not success:
-                logging.info("No message received after timeout")
         except asyncio.CancelledError:
-            logging.info("Worker cancelled, shutting down...")
-            break
+            logging.info(f"Consumer {index} cancelled")
+            raise
+        except Exception as e:
+            logging.error(f"Consumer {index} failed: {type(e)} {e}")
+            await asyncio.sleep(1)
+    logging.info(f"Consumer {index} stopped")
 
 
-def handle_shutdown(signum, frame):
+async def start_workers():
+    """Start the worker consumers and drain them on SIGTERM/SIGINT"""
+    from apps.webpages import services
+    from apps.webpages.browser import browser_pool
+    from apps.webpages.extraction import extraction_engine
+    from apps.webpages.storage import source_store
+
+    await initialize_app()
+    redis_client = await db.RedisSSHHandler().initialize()
+    await asyncio.wait_for(redis_client.ping(), timeout=10)
+
+    # keep references so the startup tasks are not garbage collected mid-run
+    url_key_task = asyncio.create_task(models.Webpage.migrate_url_keys())
+    backfill_task = asyncio.create_task(services.backfill_derived_fields())
+    prune_task = asyncio.create_task(source_store.prune())
+
+    queue = ReliableQueue(models.Webpage.queue().name, redis_client)
+    await queue.heartbeat()
+    for message in await queue.recover():
+        await mark_failed(models.Webpage, message)
+    reaper_task = asyncio.create_task(reap_stale_messages(models.Webpage, queue))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, handle_shutdown, signum, stop)
+
+    # one scheduler for all consumers so the turns are shared between them
+    scheduler = LaneScheduler(queue)
+    concurrency = config.Settings.worker_concurrency
+    consumers = [
+        asyncio.create_task(consume(i, models.Webpage, queue, scheduler, stop))
+        for i in range(concurrency)
+    ]
+    logging.info(f"Started {concurrency} consumers")
+
+    try:
+        await stop.wait()
+        # consumers finish their current message, then exit on the stop flag
+        _, pending = await asyncio.wait(
+            consumers, timeout=config.Settings.worker_drain_timeout
+        )
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        reaper_task.cancel()
+        await queue.retire()
+    finally:
+        await http_client.close()
+        browser_pool.close()
+        extraction_engine.close()
+
+
+def handle_shutdown(signum, stop: asyncio.Event):
     """Handle shutdown signals"""
     logging.info(f"Received signal {signum}. Starting graceful shutdown...")
-    # Raise KeyboardInterrupt to trigger the cleanup in the main try/except block
-    raise KeyboardInterrupt
+    stop.set()
 
 
 if __name__ == "__main__":
-    # Register signal handlers
-    signal.signal(signal.SIGTERM, handle_shutdown)
-    # Note: SIGKILL (9) cannot be caught or ignored
-
     try:
         # Start worker processes
         asyncio.run(start_workers())
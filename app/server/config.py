@@ -17,8 +17,81 @@ class Settings(config.Settings):
 
     selenium_remote_url: str = os.getenv("SELENIUM_REMOTE_URL", "http://localhost:4444")
     selenium_loading_time: int = 5
+    selenium_quiet_period_ms: int = int(os.getenv("SELENIUM_QUIET_PERIOD_MS", 500))
+    selenium_iframe_budget: float = float(os.getenv("SELENIUM_IFRAME_BUDGET", 3))
+    selenium_iframe_max: int = int(os.getenv("SELENIUM_IFRAME_MAX", 10))
+    selenium_iframe_skip: str = os.getenv(
+        "SELENIUM_IFRAME_SKIP",
+        "doubleclick.net,googlesyndication.com,googletagmanager.com,"
+        "google-analytics.com,amazon-adsystem.com,adnxs.com,criteo,taboola,"
+        "outbrain,facebook.com/plugins,facebook.com/tr,recaptcha",
+    )
     httpx_timeout: int = 10
+    httpx_http2: bool = os.getenv("HTTPX_HTTP2", "true").lower() in ("true", "1", "yes")
+    httpx_max_connections: int = int(os.getenv("HTTPX_MAX_CONNECTIONS", 100))
+    httpx_max_keepalive_connections: int = int(
+        os.getenv("HTTPX_MAX_KEEPALIVE_CONNECTIONS", 20)
+    )
+    httpx_max_connections_per_host: int = int(
+        os.getenv("HTTPX_MAX_CONNECTIONS_PER_HOST", 6)
+    )
+    httpx_keepalive_expiry: float = float(os.getenv("HTTPX_KEEPALIVE_EXPIRY", 30))
+    httpx_max_body_bytes: int = int(
+        os.getenv("HTTPX_MAX_BODY_BYTES", 10 * 1024 * 1024)
+    )
     browser_timeout: int = 20
+    browser_pool_size: int = int(os.getenv("BROWSER_POOL_SIZE", 2))
+    browser_max_uses: int = int(os.getenv("BROWSER_MAX_USES", 50))
+    browser_idle_timeout: int = int(os.getenv("BROWSER_IDLE_TIMEOUT", 240))
+
+    source_compression: str = os.getenv("SOURCE_COMPRESSION", "zstd")
+    source_tiers: str = os.getenv("SOURCE_TIERS", "memory,redis,disk")
+    source_memory_ttl: int = int(os.getenv("SOURCE_MEMORY_TTL", 60 * 10))
+    source_memory_items: int = int(os.getenv("SOURCE_MEMORY_ITEMS", 256))
+    source_memory_bytes: int = int(os.getenv("SOURCE_MEMORY_BYTES", 64 * 1024 * 1024))
+    source_ttl: int = int(os.getenv("SOURCE_TTL", 60 * 60 * 4))
+    source_disk_ttl: int = int(os.getenv("SOURCE_DISK_TTL", 60 * 60 * 24 * 14))
+    source_disk_dir: Path = Path(
+        os.getenv("SOURCE_DISK_DIR", Path(__file__).resolve().parent.parent / "data")
+    )
+    # pages older than this are refetched, independently of the source ttls
+    webpage_cache_hours: int = int(os.getenv("WEBPAGE_CACHE_HOURS", 4))
+
+    worker_concurrency: int = int(os.getenv("WORKER_CONCURRENCY", 4))
+    worker_poll_timeout: int = int(os.getenv("WORKER_POLL_TIMEOUT", 5))
+    worker_drain_timeout: int = int(os.getenv("WORKER_DRAIN_TIMEOUT", 60))
+    queue_visibility_timeout: int = int(os.getenv("QUEUE_VISIBILITY_TIMEOUT", 60 * 15))
+    queue_max_attempts: int = int(os.getenv("QUEUE_MAX_ATTEMPTS", 3))
+    queue_max_dead: int = int(os.getenv("QUEUE_MAX_DEAD", 10000))
+    queue_reaper_interval: int = int(os.getenv("QUEUE_REAPER_INTERVAL", 60))
+    # share of pops given to each priority lane when several have work
+    queue_priority_weights: str = os.getenv(
+        "QUEUE_PRIORITY_WEIGHTS", "interactive:8,bulk:1"
+    )
+    queue_interactive_backlog: int = int(os.getenv("QUEUE_INTERACTIVE_BACKLOG", 50))
+    batch_max_items: int = int(os.getenv("BATCH_MAX_ITEMS", 10000))
+    export_batch_size: int = int(os.getenv("EXPORT_BATCH_SIZE", 200))
+    fetch_lease_ttl: int = int(os.getenv("FETCH_LEASE_TTL", 120))
+    strategy_min_samples: int = int(os.getenv("STRATEGY_MIN_SAMPLES", 5))
+    strategy_min_success_rate: float = float(
+        os.getenv("STRATEGY_MIN_SUCCESS_RATE", 0.2)
+    )
+    strategy_explore_rate: float = float(os.getenv("STRATEGY_EXPLORE_RATE", 0.05))
+    strategy_ttl: int = int(os.getenv("STRATEGY_TTL", 60 * 60 * 24 * 30))
+    image_cache_ttl: int = int(os.getenv("IMAGE_CACHE_TTL", 60 * 60 * 24 * 7))
+    image_cache_negative_ttl: int = int(
+        os.getenv("IMAGE_CACHE_NEGATIVE_TTL", 60 * 60 * 24)
+    )
+    image_cache_local_ttl: int = int(os.getenv("IMAGE_CACHE_LOCAL_TTL", 60 * 10))
+    image_cache_items: int = int(os.getenv("IMAGE_CACHE_ITEMS", 10000))
+    extraction_workers: int = int(os.getenv("EXTRACTION_WORKERS", 2))
+    html_parser: str = os.getenv("HTML_PARSER", "")
+    language_max_samples: int = int(os.getenv("LANGUAGE_MAX_SAMPLES", 20))
+    image_max_candidates: int = int(os.getenv("IMAGE_MAX_CANDIDATES", 30))
+    image_probe_bytes: int = int(os.getenv("IMAGE_PROBE_BYTES", 16 * 1024))
+    image_probe_max_bytes: int = int(
+        os.getenv("IMAGE_PROBE_MAX_BYTES", 2 * 1024 * 1024)
+    )
 
     GSEARCH_API_KEY: str = os.getenv("GSEARCH_API_KEY")
     GSEARCH_CX: str = os.getenv("GSEARCH_CX")
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+import httpx
+from singleton import Singleton
+
+from .config import Settings
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpClientManager(metaclass=Singleton):
+    """Process-wide pooled httpx client shared by page and image fetching."""
+
+    def __init__(self):
+        self.client: httpx.AsyncClient | None = None
+        self.host_semaphores: dict[str, asyncio.Semaphore] = {}
+        self.host_users: dict[str, int] = {}
+
+    def create_client(self) -> httpx.AsyncClient:
+        http2 = Settings.httpx_http2 and HTTP2_AVAILABLE
+        limits = httpx.Limits(
+            max_connections=Settings.httpx_max_connections,
+            max_keepalive_connections=Settings.httpx_max_keepalive_connections,
+            keepalive_expiry=Settings.httpx_keepalive_expiry,
+        )
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=limits,
+            timeout=Settings.httpx_timeout,
+            follow_redirects=True,
+        )
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None or self.client.is_closed:
+            self.client = self.create_client()
+        return self.client
+
+    @asynccontextmanager
+    async def host_slot(self, url: str):
+        """Limit concurrent requests to the host of `url`."""
+        host = urlparse(url).hostname or ""
+        semaphore = self.host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(Settings.httpx_max_connections_per_host)
+            self.host_semaphores[host] = semaphore
+        self.host_users[host] = self.host_users.get(host, 0) + 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            self.host_users[host] -= 1
+            if not self.host_users[host]:
+                # forget idle hosts so crawling many domains does not grow the map
+                del self.host_users[host]
+                self.host_semaphores.pop(host, None)
+
+    async def close(self):
+        if self.client is not None and not self.client.is_closed:
+            await self.client.aclose()
+            logging.info("HTTP client closed")
+        self.client = None
+
+
+http_client = HttpClientManager()
@@ -0,0 +1,398 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from redis.asyncio.client import Redis
+
+from .config import Settings
+
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# a message moved into a processing list is tracked in the same step, so a
+# crash in between cannot leave it where the reaper does not look
+POP_SCRIPT = """
+for i = 6, #KEYS do
+    local raw = redis.call('LMOVE', KEYS[i], KEYS[1], 'RIGHT', 'LEFT')
+    if raw then
+        redis.call('ZADD', KEYS[2], ARGV[1], raw)
+        redis.call('HSET', KEYS[3], raw, KEYS[1])
+        return raw
+    end
+    -- forget an empty lane, a later push adds it back
+    if ARGV[i - 4] ~= '' then
+        redis.call('SREM', KEYS[4], ARGV[i - 4])
+    end
+end
+return false
+"""
+
+# only the caller that removes the message pushes it again, so reapers racing
+# each other or the owner's ack/nack cannot process it twice
+REQUEUE_SCRIPT = """
+local claimed = redis.call('ZREM', KEYS[2], ARGV[1])
+claimed = claimed + redis.call('LREM', KEYS[1], 1, ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+if claimed == 0 then
+    return 0
+end
+redis.call('LPUSH', KEYS[4], ARGV[2])
+if ARGV[3] ~= '' then
+    redis.call('SADD', KEYS[5], ARGV[3])
+end
+if ARGV[4] == '1' then
+    redis.call('LPUSH', KEYS[6], '1')
+    redis.call('LTRIM', KEYS[6], 0, tonumber(ARGV[5]) - 1)
+else
+    -- keep only the newest dead letters
+    redis.call('LTRIM', KEYS[4], 0, tonumber(ARGV[6]) - 1)
+end
+return 1
+"""
+
+# at most this many idle consumers are woken by one push
+MAX_WAKEUPS = 100
+
+
+def default_consumer_id() -> str:
+    """Unique per process, so co-located workers never share a processing list."""
+    host = os.getenv("HOSTNAME") or socket.gethostname()
+    return f"{host}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+@dataclasses.dataclass
+class QueueMessage:
+    raw: bytes | str
+    payload: dict
+    id: str
+    attempts: int = 0
+    lane: str | None = None
+
+
+class ReliableQueue:
+    """Redis list queue where messages are tracked until they are acknowledged.
+
+    `pop` atomically moves a message from the queue into the consumer's
+    processing list and records a visibility deadline. `ack` forgets it,
+    `nack` retries it; messages whose deadline passes are requeued by
+    `requeue_stale`, and after `max_attempts` they go to the dead-letter list,
+    which keeps the newest `max_dead`. A consumer keeps a long job in flight
+    by extending its deadline with `kept_in_flight`.
+    Consumers send a `heartbeat`, and `recover` requeues the processing lists
+    of consumers that stopped sending one.
+
+    Messages pushed with a priority and tenant go to their own lane list,
+    `<name>:lane:<priority>:<tenant>`, so a scheduler can pick which lane to
+    serve next; messages pushed without one use the plain `<name>` list.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        redis: Redis | None = None,
+        *,
+        worker_id: str | None = None,
+        visibility_timeout: int | None = None,
+        max_attempts: int | None = None,
+        max_dead: int | None = None,
+    ):
+        self.name = name
+        self._redis = redis
+        self.worker_id = worker_id or default_consumer_id()
+        self.visibility_timeout = (
+            visibility_timeout or Settings.queue_visibility_timeout
+        )
+        self.max_attempts = max_attempts or Settings.queue_max_attempts
+        self.max_dead = max_dead or Settings.queue_max_dead
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            from .db import redis
+
+            self._redis = redis
+        return self._redis
+
+    @property
+    def processing_key(self) -> str:
+        return self.processing_key_of(self.worker_id)
+
+    @property
+    def inflight_key(self) -> str:
+        return f"{self.name}:inflight"
+
+    @property
+    def owners_key(self) -> str:
+        return f"{self.name}:owners"
+
+    def processing_key_of(self, worker_id: str) -> str:
+        return f"{self.name}:processing:{worker_id}"
+
+    @property
+    def consumers_key(self) -> str:
+        return f"{self.name}:consumers"
+
+    @property
+    def notify_key(self) -> str:
+        return f"{self.name}:notify"
+
+    @property
+    def dead_key(self) -> str:
+        return f"{self.name}:dead"
+
+    @property
+    def lanes_key(self) -> str:
+        return f"{self.name}:lanes"
+
+    @staticmethod
+    def lane(priority: str, tenant: str) -> str:
+        return f"{priority}:{tenant}"
+
+    def lane_key(self, lane: str | None) -> str:
+        return f"{self.name}:lane:{lane}" if lane else self.name
+
+    @staticmethod
+    def encode(
+        payload: dict,
+        *,
+        id: str | None = None,
+        attempts: int = 0,
+        lane: str | None = None,
+    ) -> str:
+        data = {"id": id or uuid.uuid4().hex, "attempts": attempts, "payload": payload}
+        if lane:
+            data["lane"] = lane
+        return json.dumps(data)
+
+    @staticmethod
+    def decode(raw: bytes | str) -> QueueMessage:
+        data = json.loads(raw)
+        if "payload" not in data:
+            # plain messages pushed before the envelope was introduced
+            return QueueMessage(raw=raw, payload=data, id=uuid.uuid4().hex)
+        return QueueMessage(
+            raw=raw,
+            payload=data["payload"],
+            id=data["id"],
+            attempts=data["attempts"],
+            lane=data.get("lane"),
+        )
+
+    async def push(self, payload: dict, *, lane: str | None = None):
+        await self.push_many([payload], lane=lane)
+
+    async def push_many(self, payloads: list[dict], *, lane: str | None = None):
+        if not payloads:
+            return
+        raws = [self.encode(payload, lane=lane) for payload in payloads]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lpush(self.lane_key(lane), *raws)
+            if lane:
+                pipe.sadd(self.lanes_key, lane)
+            pipe.lpush(self.notify_key, *["1"] * min(len(raws), MAX_WAKEUPS))
+            pipe.ltrim(self.notify_key, 0, MAX_WAKEUPS - 1)
+            await pipe.execute()
+
+    async def lanes(self) -> list[str]:
+        """Lanes that may hold messages."""
+        lanes = await self.redis.smembers(self.lanes_key)
+        return sorted(lane.decode() if isinstance(lane, bytes) else lane for lane in lanes)
+
+    async def lane_length(self, lane: str) -> int:
+        return await self.redis.llen(self.lane_key(lane))
+
+    async def pop_first(self, lanes: list[str | None]) -> QueueMessage | None:
+        """Take the oldest message of the first lane in `lanes` that has one.
+
+        One round trip whatever the number of lanes; None is the plain list.
+        """
+        if not lanes:
+            return None
+        raw = await self.redis.eval(
+            POP_SCRIPT,
+            5 + len(lanes),
+            self.processing_key,
+            self.inflight_key,
+            self.owners_key,
+            self.lanes_key,
+            self.notify_key,
+            *[self.lane_key(lane) for lane in lanes],
+            time.time() + self.visibility_timeout,
+            *[lane or "" for lane in lanes],
+        )
+        if raw is None:
+            return None
+        return self.decode(raw)
+
+    async def pop_lane(self, lane: str | None) -> QueueMessage | None:
+        """Take the oldest message of `lane` without blocking."""
+        return await self.pop_first([lane])
+
+    async def wait(self, timeout: float) -> bool:
+        """Block until a push wakes this consumer or `timeout` passes."""
+        return await self.redis.blpop([self.notify_key], timeout=timeout) is not None
+
+    async def pop(self, timeout: float) -> QueueMessage | None:
+        """Take the oldest message of the plain list, waiting up to `timeout`."""
+        message = await self.pop_lane(None)
+        if message is None and await self.wait(timeout):
+            message = await self.pop_lane(None)
+        return message
+
+    async def ack(self, message: QueueMessage):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 1, message.raw)
+            pipe.zrem(self.inflight_key, message.raw)
+            pipe.hdel(self.owners_key, message.raw)
+            await pipe.execute()
+
+    async def extend(self, message: QueueMessage) -> bool:
+        """Push the deadline of a message still in flight a visibility timeout away.
+
+        Returns False when it is no longer in flight, e.g. it was requeued.
+        """
+        return bool(
+            await self.redis.zadd(
+                self.inflight_key,
+                {message.raw: time.time() + self.visibility_timeout},
+                xx=True,
+                ch=True,
+            )
+        )
+
+    @asynccontextmanager
+    async def kept_in_flight(self, message: QueueMessage):
+        """Extend the deadline of `message` in the background until the block exits."""
+
+        async def extend_periodically():
+            while True:
+                await asyncio.sleep(self.visibility_timeout / 3)
+                try:
+                    if not await self.extend(message):
+                        logging.warning(f"Message {message.id} is no longer in flight")
+                        return
+                except Exception as e:
+                    logging.error(
+                        f"Error extending message {message.id}: {type(e)} {e}"
+                    )
+
+        task = asyncio.create_task(extend_periodically())
+        try:
+            yield
+        finally:
+            task.cancel()
+
+    async def nack(self, message: QueueMessage) -> bool:
+        """Retry a failed message; return False if it was dead-lettered."""
+        return await self._requeue(message, self.processing_key) != "dead"
+
+    async def _requeue(self, message: QueueMessage, processing_key: str) -> str | None:
+        """Push `message` back or dead-letter it.
+
+        Returns "retried" or "dead", or None when another consumer already
+        acknowledged or requeued it.
+        """
+        attempts = message.attempts + 1
+        retry = attempts < self.max_attempts
+        raw = self.encode(
+            message.payload, id=message.id, attempts=attempts, lane=message.lane
+        )
+        # retries keep their lane, so they cannot jump ahead of others
+        target = self.lane_key(message.lane) if retry else self.dead_key
+        claimed = await self.redis.eval(
+            REQUEUE_SCRIPT,
+            6,
+            processing_key,
+            self.inflight_key,
+            self.owners_key,
+            target,
+            self.lanes_key,
+            self.notify_key,
+            message.raw,
+            raw,
+            (message.lane or "") if retry else "",
+            "1" if retry else "0",
+            MAX_WAKEUPS,
+            self.max_dead,
+        )
+        if not claimed:
+            return None
+        if not retry:
+            logging.warning(f"Message {message.id} dead-lettered after {attempts} attempts")
+            return "dead"
+        return "retried"
+
+    async def requeue_stale(self) -> list[QueueMessage]:
+        """Requeue in-flight messages past their deadline; return dead-lettered ones."""
+        stale = await self.redis.zrangebyscore(self.inflight_key, "-inf", time.time())
+        dead = []
+        for raw in stale:
+            processing_key = await self.redis.hget(self.owners_key, raw)
+            if processing_key is None:
+                await self.redis.zrem(self.inflight_key, raw)
+                continue
+            if isinstance(processing_key, bytes):
+                processing_key = processing_key.decode()
+            message = self.decode(raw)
+            status = await self._requeue(message, processing_key)
+            if status:
+                logging.warning(f"Requeued stale message {message.id}")
+            if status == "dead":
+                dead.append(message)
+        return dead
+
+    async def heartbeat(self, ttl: int | None = None):
+        """Mark this consumer alive for `ttl` seconds."""
+        ttl = ttl or Settings.queue_reaper_interval * 3
+        await self.redis.hset(self.consumers_key, self.worker_id, time.time() + ttl)
+
+    async def retire(self):
+        """Let other consumers recover what this one leaves in flight."""
+        await self.redis.hset(self.consumers_key, self.worker_id, 0)
+
+    async def recover(self) -> list[QueueMessage]:
+        """Requeue the processing lists of consumers whose heartbeat expired.
+
+        Returns the messages that were dead-lettered instead.
+        """
+        consumers = await self.redis.hgetall(self.consumers_key)
+        dead, recovered = [], 0
+        for worker_id, alive_until in consumers.items():
+            if isinstance(worker_id, bytes):
+                worker_id = worker_id.decode()
+            if worker_id == self.worker_id or float(alive_until) > time.time():
+                continue
+            processing_key = self.processing_key_of(worker_id)
+            for raw in await self.redis.lrange(processing_key, 0, -1):
+                message = self.decode(raw)
+                status = await self._requeue(message, processing_key)
+                recovered += status is not None
+                if status == "dead":
+                    dead.append(message)
+            await self.redis.hdel(self.consumers_key, worker_id)
+        if recovered:
+            logging.info(f"Requeued {recovered} messages of stopped consumers")
+        return dead
+
+    async def stats(self) -> dict:
+        lanes = await self.lanes()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self.name)
+            pipe.zcard(self.inflight_key)
+            pipe.llen(self.dead_key)
+            for lane in lanes:
+                pipe.llen(self.lane_key(lane))
+            queued, in_flight, dead, *lengths = await pipe.execute()
+        return {
+            "queued": queued + sum(lengths),
+            "in_flight": in_flight,
+            "dead": dead,
+            "lanes": dict(zip(lanes, lengths)),
+        }
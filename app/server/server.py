@@ -1,7 +1,23 @@
+from contextlib import asynccontextmanager
+
+from apps.webpages.extraction import extraction_engine
 from apps.webpages.routes import router as webpage_router
 from fastapi_mongo_base.core import app_factory
 
 from . import config
+from .http_client import http_client
+
+
+@asynccontextmanager
+async def lifespan(app):
+    async with app_factory.lifespan(app, settings=config.Settings()):
+        http_client.get_client()
+        yield
+    await http_client.close()
+    extraction_engine.close()
+
 
-app = app_factory.create_app(settings=config.Settings(), serve_coverage=False)
+app = app_factory.create_app(
+    settings=config.Settings(), serve_coverage=False, lifespan_func=lifespan
+)
 app.include_router(webpage_router, prefix=config.Settings.base_path)
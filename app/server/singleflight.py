@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from redis.asyncio.client import Redis
+
+# the done marker tells waiters that subscribed too late a release from an expiry
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    redis.call("del", KEYS[1])
+    redis.call("set", KEYS[3], ARGV[1], "EX", ARGV[2])
+    return redis.call("publish", KEYS[2], ARGV[1])
+end
+return -1
+"""
+
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Run at most one call per key in this process; callers share its result."""
+
+    def __init__(self):
+        self.calls: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func, *args, **kwargs):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            logging.info(f"Joining in-flight call for {key}")
+        # shield so a cancelled caller does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+
+
+class RedisLease:
+    """Cross-process lease on a key; its release is published to waiters."""
+
+    def __init__(self, key: str, ttl: int, redis: Redis | None = None):
+        self.key = key
+        self.channel = f"{key}:released"
+        self.done_key = f"{key}:done"
+        self.ttl = ttl
+        self.token = f"{os.getenv('HOSTNAME', 'unknown')}:{uuid.uuid4().hex}"
+        self._redis = redis
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            from .db import redis
+
+            self._redis = redis
+        return self._redis
+
+    async def acquire(self) -> bool:
+        return bool(await self.redis.set(self.key, self.token, nx=True, ex=self.ttl))
+
+    async def release(self):
+        await self.redis.eval(
+            RELEASE_SCRIPT, 3, self.key, self.channel, self.done_key, self.token, self.ttl
+        )
+
+    async def renew(self) -> bool:
+        """Restart the time to live; False if the lease is no longer held."""
+        return bool(
+            await self.redis.eval(RENEW_SCRIPT, 1, self.key, self.token, self.ttl)
+        )
+
+    @asynccontextmanager
+    async def kept_alive(self):
+        """Renew the held lease in the background until the block exits."""
+
+        async def renew_periodically():
+            while True:
+                await asyncio.sleep(self.ttl / 3)
+                try:
+                    if not await self.renew():
+                        logging.warning(f"Lease {self.key} was lost")
+                        return
+                except Exception as e:
+                    logging.error(f"Error renewing lease {self.key}: {type(e)} {e}")
+
+        task = asyncio.create_task(renew_periodically())
+        try:
+            yield
+        finally:
+            task.cancel()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until the current holder releases the lease or it expires.
+
+        Returns True only if the holder released it, False when it expired or
+        `timeout` passed, e.g. because the holder crashed or stalled.
+        """
+        deadline = time.monotonic() + timeout
+        pubsub = self.redis.pubsub()
+        try:
+            await pubsub.subscribe(self.channel)
+            # checked after subscribing so a release in between is not missed
+            holder = await self.redis.get(self.key)
+            if holder is None:
+                return False
+            while await self.redis.exists(self.key):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=min(remaining, 1)
+                )
+                if message:
+                    return True
+            return await self.redis.get(self.done_key) == holder
+        finally:
+            await pubsub.unsubscribe(self.channel)
+            await pubsub.aclose()
@@ -53,6 +53,18 @@ async def db(mongo_client):
     logging.info("Cleaning up database")
 
 
+@pytest_asyncio.fixture
+async def redis(monkeypatch):
+    """In-process redis, also used by code that imports `server.db.redis`."""
+    from fakeredis.aioredis import FakeRedis
+    from server import db as server_db
+
+    redis = FakeRedis()
+    monkeypatch.setattr(server_db, "redis", redis)
+    yield redis
+    await redis.flushall()
+
+
 @pytest_asyncio.fixture(scope="session")
 async def client() -> AsyncGenerator[httpx.AsyncClient, None]:
     """Fixture to provide an AsyncClient for FastAPI app."""
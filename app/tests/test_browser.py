@@ -0,0 +1,76 @@
+import threading
+from types import SimpleNamespace
+
+from apps.webpages.browser import BrowserPool
+
+
+class FakeDriver:
+    def __init__(self):
+        self.current_window_handle = "home"
+        self.contexts = {}
+        self.created = 0
+        self.window = "home"
+        self.quit_called = False
+        self.browser = SimpleNamespace(
+            create_user_context=self.create_user_context,
+            remove_user_context=self.remove_user_context,
+        )
+        self.browsing_context = SimpleNamespace(create=self.create_context)
+        self.switch_to = SimpleNamespace(window=self.switch_window)
+
+    def create_user_context(self):
+        user_context = f"user-{self.created}"
+        self.created += 1
+        self.contexts[user_context] = []
+        return user_context
+
+    def remove_user_context(self, user_context):
+        del self.contexts[user_context]
+
+    def create_context(self, type, user_context):
+        context = f"{user_context}-tab"
+        self.contexts[user_context].append(context)
+        return context
+
+    def switch_window(self, window):
+        self.window = window
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_pool_isolates_pages_and_resets_in_background(monkeypatch):
+    pool = BrowserPool(size=1, max_uses=3, idle_timeout=60)
+    drivers = []
+    def create_driver():
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    monkeypatch.setattr(pool, "create_driver", create_driver)
+    pool.executor
+
+    reset_started, reset_done = threading.Event(), threading.Event()
+    reset = pool.reset
+
+    def slow_reset(session):
+        reset_started.set()
+        reset_done.wait(1)
+        reset(session)
+
+    monkeypatch.setattr(pool, "reset", slow_reset)
+    with pool.session() as driver:
+        assert driver.window == "user-0-tab"
+    # the fetch returned before the reset finished
+    assert reset_started.wait(1)
+    assert pool.idle.empty()
+    reset_done.set()
+
+    # the only slot waits for the session being reset instead of a new one
+    with pool.session() as driver:
+        assert driver.window == "user-1-tab"
+        assert "user-0" not in driver.contexts
+    with pool.session():
+        pass
+    pool.close()
+    assert len(drivers) == 1
+    assert drivers[0].quit_called
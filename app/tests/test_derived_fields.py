@@ -0,0 +1,76 @@
+import pytest_asyncio
+from apps.webpages import services, storage
+from apps.webpages.models import Webpage
+from apps.webpages.routes import WebpageRouter
+from apps.webpages.schemas import DERIVED_FIELDS_VERSION
+
+SOURCE = (
+    "<html><head><title>Page</title>"
+    '<meta name="description" content="About the page"></head>'
+    "<body><p>Some text</p></body></html>"
+)
+
+
+@pytest_asyncio.fixture
+async def store(monkeypatch):
+    store = storage.SourceStore([storage.MemorySourceBackend(60, 10, 10**6)])
+    monkeypatch.setattr(storage, "source_store", store)
+    monkeypatch.setattr(services.extraction_engine, "workers", 0)
+    await Webpage.get_motor_collection().delete_many({})
+    yield store
+    await Webpage.get_motor_collection().delete_many({})
+
+
+async def test_finalize_persists_derived_fields(store, monkeypatch):
+    webpage = Webpage(uid="1", url="https://www.example.com/a", url_key="x")
+    await webpage.save_page_source(SOURCE)
+    await services.finalize_webpage(webpage)
+
+    stored = await Webpage.get_motor_collection().find_one({"uid": "1"})
+    assert stored["title"] == "Page"
+    assert "About the page" in stored["meta_text"]
+    assert stored["text_length"] == len(webpage.text)
+    assert stored["main_domain"] == "example.com"
+    assert stored["derived_version"] == DERIVED_FIELDS_VERSION
+
+    async def no_source(url):
+        raise AssertionError("list views must not read the source")
+
+    monkeypatch.setattr(store, "get", no_source)
+    router = WebpageRouter()
+
+    async def get_user_id(request):
+        return None
+
+    monkeypatch.setattr(router, "get_user_id", get_user_id)
+    page = await router._list_items(None)
+    [item] = page.items
+    assert item.title == "Page"
+    assert item.meta_text == stored["meta_text"]
+    assert item.text_length == stored["text_length"]
+    assert item.main_domain == "example.com"
+
+
+async def test_backfill_only_writes_derived_fields(store, monkeypatch):
+    await store.set("https://a.com", SOURCE)
+    collection = Webpage.get_motor_collection()
+    await collection.insert_one(
+        {"uid": "1", "url": "https://a.com", "task_status": "init", "images": None}
+    )
+    parse = Webpage.parse
+
+    async def parse_while_consumer_runs(self, **kwargs):
+        # a consumer finishes the page between the load and the write
+        await collection.update_one(
+            {"uid": "1"}, {"$set": {"task_status": "completed", "images": ["i"]}}
+        )
+        return await parse(self, **kwargs)
+
+    monkeypatch.setattr(Webpage, "parse", parse_while_consumer_runs)
+    await services.backfill_derived_fields()
+
+    stored = await collection.find_one({"uid": "1"})
+    assert stored["task_status"] == "completed"
+    assert stored["images"] == ["i"]
+    assert stored["title"] == "Page"
+    assert stored["derived_version"] == DERIVED_FIELDS_VERSION
@@ -0,0 +1,85 @@
+from apps.webpages.documents import (
+    content_hash,
+    parse_document,
+    with_embedded_content,
+)
+from fastapi_mongo_base.utils import texttools
+
+HTML = """
+<html>
+  <head>
+    <title> Sample page </title>
+    <meta name="description" content="A sample description">
+    <meta property="og:title" content="Sample">
+    <style>body { color: red; }</style>
+  </head>
+  <body>
+    <h1>Hello</h1>
+    <script>var ignored = true;</script>
+    <p>World   of
+    text</p>
+    <!-- a comment -->
+  </body>
+</html>
+"""
+
+
+def test_parse_document():
+    document = parse_document(HTML)
+
+    assert document.source_hash == content_hash(HTML)
+    assert document.title == "Sample page"
+    assert document.meta_text == "A sample description\nSample"
+    assert "Hello" in document.text and "World of\ntext" in document.text
+    assert "ignored" not in document.text
+    assert "color" not in document.text
+    assert "comment" not in document.text
+    assert document.text == texttools.remove_whitespace(
+        document.soup.get_text(separator=" ").strip()
+    )
+    assert not document.is_enough_text()
+
+
+def test_with_embedded_content():
+    source = """
+    <html><head>
+      <meta property="og:description" content="An article about embedded payloads">
+      <script type="application/ld+json">
+        {"@type": "Article", "url": "https://example.com/a",
+         "articleBody": "The body of the article rendered by the server."}
+      </script>
+      <script id="__NEXT_DATA__" type="application/json">
+        {"props": {"pageProps": {"items": ["A list entry with several words"]}}}
+      </script>
+    </head><body><div id="root"></div></body></html>
+    """
+    document = parse_document(with_embedded_content(source))
+
+    assert "The body of the article rendered by the server." in document.text
+    assert "A list entry with several words" in document.text
+    assert "An article about embedded payloads" in document.text
+    assert "https://example.com/a" not in document.text
+    assert with_embedded_content("<p>plain</p>") == "<p>plain</p>"
+
+
+def test_normalized_hash_ignores_numbers():
+    page = '<p>Updated {} seconds ago, enough text here</p><img src="/a.png">'
+    first = parse_document(page.format(12))
+    second = parse_document(page.format(345))
+
+    assert first.source_hash != second.source_hash
+    assert first.normalized_hash == second.normalized_hash
+    assert (
+        parse_document(page.format(12).replace("a.png", "b.png")).normalized_hash
+        != first.normalized_hash
+    )
+
+
+def test_normalized_hash_covers_image_candidates():
+    page = (
+        '<meta property="og:image" content="/{}.jpg">'
+        '<img data-src="/{}.jpg"><p>Same text on every page</p>'
+    )
+    first = parse_document(page.format("a", "b")).normalized_hash
+    assert parse_document(page.format("c", "b")).normalized_hash != first
+    assert parse_document(page.format("a", "c")).normalized_hash != first
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from apps.webpages.export import export_record
+
+
+def test_export_record():
+    record = export_record(
+        {
+            "uid": "1",
+            "url": "https://example.com",
+            "title": "Example",
+            "languages": {"en": 75.0, "fr": 25.0},
+            "task_status": "completed",
+            "updated_at": datetime(2024, 1, 2, 3, 4, 5),
+        },
+        "some text",
+    )
+    assert record["language"] == "en"
+    assert record["text"] == "some text"
+    assert record["status"] == "completed"
+    assert record["updated_at"] == "2024-01-02T03:04:05"
+    assert export_record({"url": "https://example.com"}, None)["language"] is None
+
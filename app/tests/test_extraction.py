@@ -0,0 +1,26 @@
+from apps.webpages.documents import parse_document
+from apps.webpages.extraction import ExtractionEngine, html_parser
+
+SOURCE = """
+<html><head><title>Pool page</title><meta name="description" content="Meta">
+</head><body><h1>Heading 42</h1><p>Some text in a paragraph.</p>
+<script type="application/ld+json">{"headline": "Embedded"}</script>
+<img src="/a.jpg" width="800" height="800"></body></html>
+"""
+
+
+async def test_pool_results_match_in_process_parse():
+    engine = ExtractionEngine(workers=1)
+    try:
+        pooled = await engine.extract(SOURCE, base_url="https://a.com")
+        text = await engine.text(SOURCE)
+    finally:
+        engine.close()
+
+    local = parse_document(SOURCE, parser=html_parser())
+    assert pooled.soup is None
+    assert pooled.source_hash == local.source_hash
+    assert pooled.text == local.text == text
+    assert pooled.title == local.title
+    assert pooled.meta_text == local.meta_text
+    assert pooled.normalized_hash == local.normalized_hash
@@ -0,0 +1,223 @@
+import asyncio
+
+import httpx
+import pytest_asyncio
+from apps.webpages import services, storage
+from apps.webpages.models import Webpage
+from apps.webpages.schemas import WebpageCreateSchema
+from server.config import Settings
+from server.http_client import http_client
+
+SHORT = "<html><head><title>Short</title></head><body><p>Little text</p></body></html>"
+
+
+@pytest_asyncio.fixture
+async def webpage(monkeypatch, redis):
+    store = storage.SourceStore([storage.MemorySourceBackend(60, 10, 10**6)])
+    monkeypatch.setattr(storage, "source_store", store)
+    monkeypatch.setattr(services.extraction_engine, "workers", 0)
+    await Webpage.get_motor_collection().delete_many({})
+    [webpage] = await Webpage.get_or_create_many(
+        [WebpageCreateSchema(url="https://a.com")]
+    )
+    yield webpage
+    await Webpage.get_motor_collection().delete_many({})
+
+
+async def test_failed_browser_keeps_earlier_source(webpage, monkeypatch):
+    async def fetch_webpage_direct(webpage, **kwargs):
+        return {"source_code": SHORT}
+
+    async def fetch_webpage_dynamic(webpage, **kwargs):
+        return None
+
+    monkeypatch.setattr(services, "fetch_webpage_direct", fetch_webpage_direct)
+    monkeypatch.setattr(services, "fetch_webpage_dynamic", fetch_webpage_dynamic)
+
+    webpage = await services.fetch_webpage_unshared(webpage)
+    assert webpage.crawl_method == "embedded"
+    assert await storage.source_store.get(webpage.url) == SHORT
+    assert webpage.title == "Short"
+
+
+async def test_failed_refetch_keeps_stored_source(webpage, monkeypatch):
+    await webpage.save_page_source(SHORT)
+    await webpage.save()
+
+    async def fetch_webpage_direct(webpage, **kwargs):
+        return {"error": "timeout"}
+
+    async def fetch_webpage_dynamic(webpage, **kwargs):
+        return None
+
+    monkeypatch.setattr(services, "fetch_webpage_direct", fetch_webpage_direct)
+    monkeypatch.setattr(services, "fetch_webpage_dynamic", fetch_webpage_dynamic)
+
+    webpage = await services.fetch_webpage_unshared(webpage, force_refetch=True)
+    assert webpage.crawl_method == "direct"
+    assert await storage.source_store.get(webpage.url) == SHORT
+
+
+async def test_forced_refetch_does_not_join_plain_fetch(webpage, monkeypatch):
+    calls = []
+
+    async def fetch_webpage_unshared(webpage, **kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.05)
+        return webpage
+
+    monkeypatch.setattr(services, "fetch_webpage_unshared", fetch_webpage_unshared)
+    await asyncio.gather(
+        services.fetch_webpage(webpage),
+        services.fetch_webpage(webpage),
+        services.fetch_webpage(webpage, force_refetch=True),
+    )
+    assert calls == [{}, {"force_refetch": True}]
+
+
+@pytest_asyncio.fixture
+async def serve(monkeypatch):
+    """Serve pages with `handler` through the shared client."""
+
+    def serve(handler):
+        monkeypatch.setattr(
+            http_client,
+            "client",
+            httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+
+    yield serve
+    await http_client.close()
+
+
+def streamed(*chunks: bytes, sent: list | None = None):
+    async def stream():
+        for chunk in chunks:
+            if sent is not None:
+                sent.append(chunk)
+            yield chunk
+
+    return stream()
+
+
+async def test_direct_fetch_caps_body(webpage, serve, monkeypatch):
+    monkeypatch.setattr(Settings, "httpx_max_body_bytes", 1000)
+    sent = []
+    serve(
+        lambda request: httpx.Response(
+            200,
+            headers={"Content-Type": "text/html"},
+            content=streamed(*[b"<p>" + b"x" * 500 + b"</p>"] * 10, sent=sent),
+        )
+    )
+    result = await services.fetch_webpage_direct(webpage)
+    assert result["truncated"]
+    assert len(result["source_code"]) == 1000
+    assert len(sent) < 10
+
+
+async def test_direct_fetch_decodes_split_characters(webpage, serve):
+    body = "<html><body><p>Привет, мир</p></body></html>".encode("utf-8")
+    # split inside a two byte character
+    chunks = (body[:18], body[18:])
+    serve(
+        lambda request: httpx.Response(
+            200,
+            headers={"Content-Type": "text/html; charset=utf-8"},
+            content=streamed(*chunks),
+        )
+    )
+    result = await services.fetch_webpage_direct(webpage)
+    assert result["source_code"] == body.decode("utf-8")
+    assert not result["truncated"]
+
+    legacy = '<meta charset="windows-1251"><p>Привет</p>'
+    serve(
+        lambda request: httpx.Response(
+            200,
+            headers={"Content-Type": "text/html"},
+            content=streamed(legacy.encode("windows-1251")),
+        )
+    )
+    result = await services.fetch_webpage_direct(webpage)
+    assert result["source_code"] == legacy
+
+
+async def test_direct_fetch_rejects_non_html_from_headers(webpage, serve):
+    sent = []
+    serve(
+        lambda request: httpx.Response(
+            200,
+            headers={"Content-Type": "application/pdf"},
+            content=streamed(b"%PDF" * 100, sent=sent),
+        )
+    )
+    assert await services.fetch_webpage_direct(webpage) == {"error": "not_html"}
+    assert sent == []
+
+
+async def test_truncated_source_is_recorded(webpage, monkeypatch):
+    async def fetch_webpage_direct(webpage, **kwargs):
+        return {"source_code": SHORT, "truncated": True}
+
+    monkeypatch.setattr(services, "fetch_webpage_direct", fetch_webpage_direct)
+    webpage = await services.fetch_webpage_unshared(webpage, crawl_method="direct")
+    assert webpage.truncated
+    assert (await Webpage.get_item(webpage.uid)).truncated
+
+
+async def stored_direct_page(webpage: Webpage) -> Webpage:
+    webpage.crawl_method = "direct"
+    webpage.etag = '"v1"'
+    await webpage.save_page_source(SHORT)
+    return await services.finalize_webpage(webpage)
+
+
+def revalidating(requests: list):
+    """A server answering 304 to `If-None-Match` with a new validator."""
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if request.headers.get("If-None-Match"):
+            return httpx.Response(304, headers={"ETag": '"v2"'})
+        return httpx.Response(
+            200, headers={"Content-Type": "text/html", "ETag": '"v3"'}, content=SHORT
+        )
+
+    return handler
+
+
+async def test_not_modified_keeps_source_without_parsing(webpage, serve, monkeypatch):
+    await stored_direct_page(webpage)
+    requests = []
+    serve(revalidating(requests))
+    parsed = []
+    parse = Webpage.parse
+
+    async def counting_parse(self, **kwargs):
+        parsed.append(self.url)
+        return await parse(self, **kwargs)
+
+    monkeypatch.setattr(Webpage, "parse", counting_parse)
+    webpage = await services.fetch_webpage_unshared(webpage, force_refetch=True)
+
+    assert [request.headers.get("If-None-Match") for request in requests] == ['"v1"']
+    assert parsed == []
+    assert webpage.etag == '"v2"'
+    assert (await Webpage.get_item(webpage.uid)).etag == '"v2"'
+    assert await storage.source_store.get(webpage.url) == SHORT
+
+
+async def test_not_modified_after_source_expired_refetches(webpage, serve):
+    await stored_direct_page(webpage)
+    await storage.source_store.delete(webpage.url)
+    requests = []
+    serve(revalidating(requests))
+
+    webpage = await services.fetch_webpage_unshared(webpage, force_refetch=True)
+    assert [request.headers.get("If-None-Match") for request in requests] == [
+        '"v1"',
+        None,
+    ]
+    assert webpage.etag == '"v3"'
+    assert await storage.source_store.get(webpage.url) == SHORT
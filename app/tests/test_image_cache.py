@@ -0,0 +1,58 @@
+import pytest
+from apps.webpages.image_cache import ImageMetadataCache
+
+URL = "https://example.com/a.png"
+FOUND = {
+    "status": 200,
+    "width": 640,
+    "height": 480,
+    "content_length": 1024,
+    "content_type": "image/png",
+}
+
+
+@pytest.fixture
+def cache(redis):
+    return ImageMetadataCache(redis, ttl=3600, negative_ttl=60, local_ttl=300)
+
+
+async def test_local_hit_does_not_read_redis(cache, redis):
+    await cache.set(URL, FOUND)
+    await redis.flushall()
+
+    assert await cache.get(URL) == FOUND
+
+
+async def test_redis_hit_fills_local_cache(cache, redis):
+    await cache.set(URL, FOUND)
+    # another worker, with an empty in-process cache
+    other = ImageMetadataCache(redis, ttl=3600, negative_ttl=60, local_ttl=300)
+
+    assert await other.get(URL) == FOUND
+    assert other.local.get(URL) == FOUND
+
+
+async def test_miss(cache):
+    assert await cache.get(URL) is None
+
+
+async def test_found_metadata_keeps_ttl(cache, redis):
+    await cache.set(URL, FOUND)
+
+    assert 3500 < await redis.ttl(cache.key(URL)) <= 3600
+
+
+@pytest.mark.parametrize("status", [404, 0])
+async def test_failures_use_negative_ttl(cache, redis, status):
+    await cache.set(URL, {"status": status})
+
+    assert 0 < await redis.ttl(cache.key(URL)) <= 60
+    assert await cache.get(URL) == {"status": status}
+
+
+async def test_set_replaces_earlier_fields(cache, redis):
+    await cache.set(URL, FOUND)
+    await cache.set(URL, {"status": 404, "width": None})
+    cache.local.clear()
+
+    assert await cache.get(URL) == {"status": 404}
@@ -0,0 +1,43 @@
+from apps.webpages.image_candidates import (
+    parse_srcset,
+    rank_image_candidates,
+    url_size_hint,
+    variant_key,
+)
+from bs4 import BeautifulSoup
+
+HTML = """
+<html><head>
+  <meta property="og:image" content="https://cdn.example.com/hero.jpg?w=1200">
+</head><body>
+  <img src="/photo-300x200.jpg"
+       srcset="/photo-300x200.jpg 300w, /photo-800x800.jpg 800w, /photo-3000x3000.jpg 3000w">
+  <img src="/pixel.gif" width="1" height="1">
+  <img src="/icon.png" width="32" height="32">
+  <img src="/banner.jpg" width="1200" height="200">
+  <img src="https://cdn.example.com/hero.jpg?w=800">
+  <div style="background: url('/bg/large.webp')"></div>
+</body></html>
+"""
+
+
+def test_rank_image_candidates():
+    urls = rank_image_candidates(
+        BeautifulSoup(HTML, "html.parser"), "https://example.com/page", HTML
+    )
+
+    assert urls == [
+        "https://cdn.example.com/hero.jpg?w=1200",
+        "https://example.com/photo-800x800.jpg",
+        "https://example.com/bg/large.webp",
+    ]
+    assert rank_image_candidates(
+        BeautifulSoup(HTML, "html.parser"), "https://example.com/page", HTML, limit=1
+    ) == ["https://cdn.example.com/hero.jpg?w=1200"]
+
+
+def test_size_hints():
+    assert parse_srcset("a.jpg 1x, b.jpg 2x") == [("a.jpg", None, 1.0), ("b.jpg", None, 2.0)]
+    assert url_size_hint("https://x.com/a.jpg?width=640&h=480") == (640, 480)
+    assert url_size_hint("https://x.com/a-150x150.png") == (150, 150)
+    assert variant_key("https://x.com/a-150x150.png?w=1&id=3") == "https://x.com/a.png?id=3"
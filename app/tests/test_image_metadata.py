@@ -0,0 +1,133 @@
+from io import BytesIO
+
+import httpx
+import pytest_asyncio
+from apps.webpages import services
+from apps.webpages.image_cache import ImageMetadataCache
+from PIL import Image, ImageFile
+from server.config import Settings
+from server.http_client import http_client
+
+
+def encode(image_format: str, size=(640, 480), **params) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+PNG = encode("PNG")
+# the exif block pushes the size of the jpeg past the first probe
+JPEG = encode("JPEG", exif=b"Exif\x00\x00" + b"\x00" * 2048)
+
+
+@pytest_asyncio.fixture
+async def serve(monkeypatch, redis):
+    """Serve images with `handler` through the shared client."""
+    monkeypatch.setattr(services, "image_cache", ImageMetadataCache(redis))
+    monkeypatch.setattr(Settings, "image_probe_bytes", 256)
+    requests = []
+
+    def serve(handler):
+        def record(request: httpx.Request):
+            requests.append(request)
+            return handler(request)
+
+        monkeypatch.setattr(
+            http_client,
+            "client",
+            httpx.AsyncClient(transport=httpx.MockTransport(record)),
+        )
+        return requests
+
+    yield serve
+    await http_client.close()
+
+
+def ranged(data: bytes):
+    """A server honouring `Range` with 206 responses."""
+
+    def handler(request: httpx.Request):
+        range_header = request.headers.get("Range")
+        if not range_header:
+            return httpx.Response(200, content=data)
+        start, end = map(int, range_header.removeprefix("bytes=").split("-"))
+        body = data[start : end + 1]
+        content_range = f"bytes {start}-{start + len(body) - 1}/{len(data)}"
+        return httpx.Response(
+            206, content=body, headers={"Content-Range": content_range}
+        )
+
+    return handler
+
+
+async def test_probe_reads_size_from_range(serve):
+    requests = serve(ranged(PNG))
+    metadata = await services.get_cached_image_metadata("https://img.com/a.png")
+    assert metadata["width"] == 640 and metadata["height"] == 480
+    assert metadata["content_length"] == len(PNG)
+    assert metadata["status"] == 200
+    assert len(requests) == 1
+
+
+async def test_probe_ignored_range_uses_content_length(serve):
+    requests = serve(lambda request: httpx.Response(200, content=PNG))
+    metadata = await services.get_cached_image_metadata("https://img.com/a.png")
+    assert (metadata["width"], metadata["height"]) == (640, 480)
+    assert metadata["content_length"] == len(PNG)
+    assert len(requests) == 1
+
+
+async def test_probe_streams_again_when_header_is_past_range(serve):
+    requests = serve(ranged(JPEG))
+    metadata = await services.get_cached_image_metadata("https://img.com/a.jpg")
+    assert (metadata["width"], metadata["height"]) == (640, 480)
+    assert metadata["content_length"] == len(JPEG)
+    assert [request.headers.get("Range") for request in requests] == [
+        "bytes=0-255",
+        None,
+    ]
+
+
+async def test_probe_stops_at_max_bytes(serve, monkeypatch):
+    monkeypatch.setattr(Settings, "image_probe_max_bytes", 1024)
+    sent = []
+
+    async def endless():
+        while True:
+            sent.append(512)
+            yield b"\x00" * 512
+
+    serve(lambda request: httpx.Response(200, content=endless()))
+    metadata = await services.get_cached_image_metadata("https://img.com/a.bin")
+    assert metadata == {"status": 0}
+    assert sum(sent) <= 2048
+
+
+async def test_corrupt_image_is_cached_as_unreadable(serve, monkeypatch):
+    def feed(self, data):
+        raise OSError("image file is truncated")
+
+    monkeypatch.setattr(ImageFile.Parser, "feed", feed)
+    requests = serve(lambda request: httpx.Response(200, content=b"\x01" * 64))
+    url = "https://img.com/a.tif"
+    assert not await services.get_image_verification(url)
+    assert await services.get_cached_image_metadata(url) == {"status": 0}
+    assert len(requests) == 1
+
+
+async def test_missing_image_is_not_fetched_again(serve):
+    requests = serve(lambda request: httpx.Response(404))
+    url = "https://img.com/gone.png"
+    assert await services.get_cached_image_metadata(url) == {"status": 404}
+    assert await services.get_cached_image_metadata(url) == {"status": 404}
+    assert len(requests) == 1
+
+
+async def test_cached_metadata_is_shared_between_workers(serve, redis):
+    requests = serve(ranged(PNG))
+    url = "https://img.com/a.png"
+    metadata = await services.get_cached_image_metadata(url)
+    # a worker with an empty in-process cache reads the metadata from redis
+    services.image_cache.local.clear()
+    assert await services.get_cached_image_metadata(url) == metadata
+    assert len(requests) == 1
@@ -0,0 +1,37 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from utils.imagesize import get_image_size, image_format
+
+
+def encode(image_format: str, size=(640, 480), **params) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    "name, params",
+    [
+        ("PNG", {}),
+        ("GIF", {}),
+        ("JPEG", {}),
+        ("JPEG", {"progressive": True, "exif": b"Exif\x00\x00" + b"\x00" * 2048}),
+        ("BMP", {}),
+        ("WEBP", {}),
+        ("WEBP", {"lossless": True}),
+    ],
+)
+def test_get_image_size(name: str, params: dict):
+    data = encode(name, **params)
+
+    assert image_format(data) == name.lower()
+    assert get_image_size(data) == (640, 480)
+
+
+def test_get_image_size_needs_enough_data():
+    data = encode("JPEG", exif=b"Exif\x00\x00" + b"\x00" * 4096)
+
+    assert get_image_size(data[:1024]) is None
+    assert get_image_size(b"not an image") is None
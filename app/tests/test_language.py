@@ -0,0 +1,27 @@
+from apps.webpages.language import detect_languages, is_valid_language, sample_chunks
+
+ENGLISH = "The quick brown fox jumps over the lazy dog near the river bank. " * 8
+PERSIAN = "این یک متن فارسی است که برای آزمایش تشخیص زبان نوشته شده است و ادامه دارد. " * 7
+
+
+def test_sample_chunks_is_bounded_and_spread():
+    text = "".join(f"{i:04d}" + "x" * 496 for i in range(100))
+    samples = sample_chunks(text, max_samples=10)
+
+    assert len(samples) == 10
+    assert samples[0].startswith("0000") and samples[-1].startswith("0090")
+
+
+def test_detect_languages():
+    english = detect_languages(ENGLISH * 10)
+    assert english == detect_languages(ENGLISH * 10)
+    assert english["en"] == 100
+    assert is_valid_language(english, ["fa"])
+
+    mixed = detect_languages(PERSIAN * 5 + ENGLISH * 5)
+    assert not is_valid_language(mixed, ["fa"])
+    # the full distribution is kept, so other rules can be checked against it
+    assert round(sum(mixed.values())) == 100
+    assert mixed["en"] > 20
+    assert is_valid_language(mixed, ["de"])
+    assert is_valid_language(mixed, ["fa"], threshold=90)
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+from server.queue import ReliableQueue
+
+
+def make_queue(redis, worker_id="worker-1", **kwargs) -> ReliableQueue:
+    return ReliableQueue(
+        "test_queue",
+        redis,
+        worker_id=worker_id,
+        **{"visibility_timeout": 60, "max_attempts": 2} | kwargs,
+    )
+
+
+async def test_pop_tracks_and_ack_forgets(redis):
+    queue = make_queue(redis)
+    await queue.push({"uid": "1"})
+
+    message = await queue.pop(timeout=0.1)
+    assert message.payload == {"uid": "1"}
+    assert message.attempts == 0
+    assert await redis.lrange(queue.processing_key, 0, -1) == [message.raw]
+    assert await redis.zscore(queue.inflight_key, message.raw) > time.time()
+    assert await redis.hget(queue.owners_key, message.raw) == queue.processing_key.encode()
+    assert (await queue.stats())["in_flight"] == 1
+
+    await queue.ack(message)
+    assert await queue.stats() == {"queued": 0, "in_flight": 0, "dead": 0, "lanes": {}}
+    assert await queue.pop(timeout=0.1) is None
+
+
+async def test_nack_retries_then_dead_letters(redis):
+    queue = make_queue(redis)
+    await queue.push({"uid": "1"}, lane="bulk:a")
+
+    message = await queue.pop_lane("bulk:a")
+    assert await queue.nack(message)
+    retried = await queue.pop_lane("bulk:a")
+    assert retried.id == message.id
+    assert retried.attempts == 1
+
+    assert not await queue.nack(retried)
+    stats = await queue.stats()
+    assert stats["dead"] == 1
+    assert stats["queued"] == stats["in_flight"] == 0
+    # an empty lane is forgotten by the pop that finds it empty
+    assert await queue.lanes() == ["bulk:a"]
+    assert await queue.pop_lane("bulk:a") is None
+    assert await queue.lanes() == []
+
+
+async def test_requeue_stale_claims_each_message_once(redis):
+    queue = make_queue(redis)
+    other_reaper = make_queue(redis, worker_id="worker-2")
+    await queue.push({"uid": "1"})
+    message = await queue.pop(timeout=0.1)
+    await redis.zadd(queue.inflight_key, {message.raw: time.time() - 1})
+
+    assert await queue.requeue_stale() == []
+    assert await other_reaper.requeue_stale() == []
+    assert (await queue.stats())["queued"] == 1
+
+    # the owner's late ack or nack does not push it a second time
+    assert await queue.nack(message)
+    assert (await queue.stats())["queued"] == 1
+    assert (await queue.pop(timeout=0.1)).attempts == 1
+
+
+async def test_recover_only_takes_over_stopped_consumers(redis):
+    alive = make_queue(redis, worker_id="alive")
+    stopped = make_queue(redis, worker_id="stopped")
+    recovering = make_queue(redis, worker_id="recovering")
+    await alive.push_many([{"uid": "1"}, {"uid": "2"}])
+    await alive.heartbeat()
+    await stopped.heartbeat()
+    await alive.pop(timeout=0.1)
+    await stopped.pop(timeout=0.1)
+
+    assert await recovering.recover() == []
+    assert (await recovering.stats())["queued"] == 0
+
+    await stopped.retire()
+    assert await recovering.recover() == []
+    assert await redis.llen(stopped.processing_key) == 0
+    assert await redis.llen(alive.processing_key) == 1
+    message = await recovering.pop(timeout=0.1)
+    assert message.payload == {"uid": "2"}
+    assert message.attempts == 1
+
+
+async def test_default_consumer_ids_are_unique(redis):
+    assert ReliableQueue("a", redis).worker_id != ReliableQueue("a", redis).worker_id
+
+
+async def test_kept_in_flight_extends_deadline(redis):
+    queue = make_queue(redis, visibility_timeout=1)
+    await queue.push({"uid": "1"})
+    message = await queue.pop(timeout=0.1)
+
+    async with queue.kept_in_flight(message):
+        await asyncio.sleep(1.2)
+        # the job outlived its first deadline and is still not stale
+        assert await queue.requeue_stale() == []
+        assert await queue.pop(timeout=0.1) is None
+
+    await queue.ack(message)
+    assert not await queue.extend(message)
+
+
+async def test_dead_letters_are_capped(redis):
+    queue = make_queue(redis, max_attempts=1, max_dead=2)
+    for uid in "123":
+        await queue.push({"uid": uid})
+        await queue.nack(await queue.pop(timeout=0.1))
+    dead = await redis.lrange(queue.dead_key, 0, -1)
+    assert [ReliableQueue.decode(raw).payload["uid"] for raw in dead] == ["3", "2"]
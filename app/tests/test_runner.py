@@ -0,0 +1,55 @@
+import pytest_asyncio
+from apps.webpages import services, storage
+from apps.webpages.models import Webpage
+from apps.webpages.schemas import WebpageCreateSchema
+from runner import process_message
+
+SOURCE = (
+    "<html><head><title>Page</title></head><body>"
+    + "<p>Enough words to count as a page with text. </p>" * 20
+    + '<img src="https://img.com/a.jpg"></body></html>'
+)
+
+
+@pytest_asyncio.fixture
+async def webpage(monkeypatch, redis):
+    store = storage.SourceStore([storage.MemorySourceBackend(60, 10, 10**6)])
+    monkeypatch.setattr(storage, "source_store", store)
+    monkeypatch.setattr(services.extraction_engine, "workers", 0)
+    await Webpage.get_motor_collection().delete_many({})
+    [webpage] = await Webpage.get_or_create_many(
+        [WebpageCreateSchema(url="https://a.com")]
+    )
+    yield webpage
+    await Webpage.get_motor_collection().delete_many({})
+
+
+async def test_browser_refetch_keeps_images_of_unchanged_page(webpage, monkeypatch):
+    async def fetch_webpage_dynamic(webpage, **kwargs):
+        return {"source_code": SOURCE, "images": [], "iframes": [], "timings": {}}
+
+    verified = []
+
+    async def get_image_verification(image_url, *args):
+        verified.append(image_url)
+        return True
+
+    monkeypatch.setattr(services, "fetch_webpage_dynamic", fetch_webpage_dynamic)
+    monkeypatch.setattr(services, "get_image_verification", get_image_verification)
+    data = {"uid": webpage.uid, "crawl_method": "browser", "meta_data": {}}
+
+    assert await process_message(Webpage, data)
+    stored = await Webpage.get_item(webpage.uid)
+    assert stored.images == ["https://img.com/a.jpg"]
+    assert verified == ["https://img.com/a.jpg"]
+
+    # the same content fetched again is not verified again, nor wiped
+    assert await process_message(Webpage, data | {"force_refetch": True})
+    stored = await Webpage.get_item(webpage.uid)
+    assert stored.images == ["https://img.com/a.jpg"]
+    assert len(verified) == 1
+
+    # other options are a different result
+    meta_data = {"min_acceptable_side": 100}
+    assert await process_message(Webpage, data | {"meta_data": meta_data})
+    assert len(verified) == 2
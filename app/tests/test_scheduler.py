@@ -0,0 +1,51 @@
+from runner import LaneScheduler, parse_weights
+from server.queue import ReliableQueue
+
+
+def test_parse_weights():
+    assert parse_weights("interactive:8, bulk:1") == {"interactive": 8, "bulk": 1}
+    assert parse_weights("interactive,bulk:0") == {"interactive": 1, "bulk": 1}
+
+
+def test_priority_order_is_weighted():
+    scheduler = LaneScheduler(ReliableQueue("test"), {"interactive": 3, "bulk": 1})
+    chosen = [
+        scheduler.priority_order(["interactive", "bulk"])[0] for _ in range(8)
+    ]
+    assert chosen.count("interactive") == 6
+    assert chosen.count("bulk") == 2
+    # the other priorities stay as fallbacks when the chosen one is empty
+    assert sorted(scheduler.priority_order(["bulk", "interactive"])) == [
+        "bulk",
+        "interactive",
+    ]
+    assert scheduler.priority_order(["bulk"]) == ["bulk"]
+
+
+def test_lane_order_rotates_tenants():
+    scheduler = LaneScheduler(ReliableQueue("test"), {"bulk": 1})
+    lanes = ["bulk:a", "bulk:b", "bulk:c"]
+    firsts = []
+    for _ in range(4):
+        firsts.append(scheduler.lane_order("bulk", lanes)[0])
+        scheduler.served("bulk", lanes, firsts[-1])
+    assert firsts == ["bulk:a", "bulk:b", "bulk:c", "bulk:a"]
+    # a tenant served out of turn moves the turn past it
+    scheduler.served("bulk", lanes, "bulk:c")
+    assert scheduler.lane_order("bulk", lanes) == ["bulk:a", "bulk:b", "bulk:c"]
+    assert sorted(scheduler.lane_order("bulk", lanes)) == lanes
+
+
+async def test_scheduler_pops_by_weight_and_tenant(redis):
+    queue = ReliableQueue("test_queue", redis, worker_id="worker-1")
+    await queue.push_many([{"uid": f"a{i}"} for i in range(4)], lane="bulk:a")
+    await queue.push_many([{"uid": f"b{i}"} for i in range(2)], lane="bulk:b")
+    await queue.push_many([{"uid": f"i{i}"} for i in range(4)], lane="interactive:c")
+    scheduler = LaneScheduler(queue, {"interactive": 3, "bulk": 1})
+
+    order = []
+    while message := await scheduler.pop(timeout=0.1):
+        order.append(message.payload["uid"])
+        await queue.ack(message)
+    assert order == ["i0", "i1", "a0", "i2", "i3", "b0", "a1", "b1", "a2", "a3"]
+    assert await queue.lanes() == []
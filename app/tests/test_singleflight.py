@@ -0,0 +1,80 @@
+import asyncio
+
+from server.singleflight import RedisLease, SingleFlight
+
+
+async def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    results = await asyncio.gather(*[flights.do("key", fetch, 2) for _ in range(3)])
+    assert results == [4, 4, 4]
+    assert calls == [2]
+    assert flights.calls == {}
+    assert await flights.do("key", fetch, 3) == 6
+
+
+async def test_lease_acquire_and_release(redis):
+    lease = RedisLease("test:lease", ttl=10, redis=redis)
+    other = RedisLease("test:lease", ttl=10, redis=redis)
+    assert await lease.acquire()
+    assert not await other.acquire()
+
+    # only the holder can release or renew
+    await other.release()
+    assert not await other.renew()
+    assert await lease.renew()
+    assert await redis.exists("test:lease")
+
+    await lease.release()
+    assert await other.acquire()
+
+
+async def test_lease_wait_reports_release(redis):
+    lease = RedisLease("test:lease", ttl=10, redis=redis)
+    waiter = RedisLease("test:lease", ttl=10, redis=redis)
+    await lease.acquire()
+
+    async def release_soon():
+        await asyncio.sleep(0.05)
+        await lease.release()
+
+    released, _ = await asyncio.gather(waiter.wait(2), release_soon())
+    assert released
+
+
+async def test_lease_wait_times_out_on_stalled_holder(redis):
+    lease = RedisLease("test:lease", ttl=10, redis=redis)
+    waiter = RedisLease("test:lease", ttl=10, redis=redis)
+    await lease.acquire()
+    assert not await waiter.wait(0.1)
+
+    # an expired lease is not a release, even with an older release marker
+    await lease.release()
+    holder = RedisLease("test:lease", ttl=10, redis=redis)
+    await holder.acquire()
+
+    async def expire_soon():
+        await asyncio.sleep(0.05)
+        await redis.delete(holder.key)
+
+    released, _ = await asyncio.gather(waiter.wait(2), expire_soon())
+    assert not released
+
+
+async def test_duplicate_queue_requests_merge_overrides(redis):
+    from apps.webpages.models import Webpage
+
+    webpage = Webpage(uid="00000000-0000-0000-0000-000000000001", url="https://a.com")
+    assert await webpage.push_to_queue(meta_data={})
+    assert not await webpage.push_to_queue(force_refetch=True, crawl_method="browser")
+    assert await webpage.pop_queued_overrides() == {
+        "force_refetch": True,
+        "crawl_method": "browser",
+    }
+    assert await webpage.pop_queued_overrides() == {}
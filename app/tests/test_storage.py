@@ -0,0 +1,157 @@
+import os
+import time
+
+import pytest
+from apps.webpages import storage
+from apps.webpages.storage import (
+    GZIP_HEADER,
+    ZSTD_HEADER,
+    FileSystemSourceBackend,
+    MemorySourceBackend,
+    RedisSourceBackend,
+    SourceStore,
+    compress_source,
+    decompress_source,
+)
+from server.config import Settings
+
+SOURCE = "<html><body><p>سلام, página</p></body></html>" * 20
+
+
+class BrokenBackend(MemorySourceBackend):
+    name = "broken"
+
+    async def get(self, url):
+        raise ConnectionError("down")
+
+    async def set(self, url, value, ttl=None):
+        raise ConnectionError("down")
+
+    async def touch(self, url, ttl=None):
+        raise ConnectionError("down")
+
+    async def ttl(self, url):
+        raise ConnectionError("down")
+
+    async def exists_many(self, urls):
+        raise ConnectionError("down")
+
+
+def memory(ttl=60) -> MemorySourceBackend:
+    return MemorySourceBackend(ttl, 10, 10**6)
+
+
+async def test_source_store_get_many():
+    hot, cold = memory(), memory()
+    store = SourceStore([hot, cold])
+    await store.set("https://a.com", "<p>a</p>")
+    await cold.set("https://b.com", b"<p>b</p>")
+
+    urls = ["https://a.com", "https://b.com", "https://c.com"]
+    assert await store.get_many(urls) == ["<p>a</p>", "<p>b</p>", None]
+    # bulk reads do not promote into the faster tiers
+    assert await hot.get("https://b.com") is None
+
+
+async def test_get_promotes_with_remaining_ttl():
+    hot, cold = memory(ttl=600), memory(ttl=60)
+    store = SourceStore([hot, cold])
+    await cold.set("https://a.com", b"<p>a</p>")
+
+    assert await store.get("https://a.com") == "<p>a</p>"
+    assert await hot.get("https://a.com") == b"<p>a</p>"
+    # the faster tier does not keep it longer than the tier it came from
+    assert await hot.ttl("https://a.com") <= 60
+
+
+async def test_source_store_skips_failing_tier():
+    hot = memory()
+    store = SourceStore([BrokenBackend(60, 10, 10**6), hot])
+    await store.set("https://a.com", "<p>a</p>")
+    assert await store.get("https://a.com") == "<p>a</p>"
+    assert await store.touch("https://a.com")
+    assert await store.exists("https://a.com")
+    assert await store.exists_many(["https://a.com", "https://b.com"]) == [True, False]
+    assert await store.ttl("https://a.com") > 0
+
+    broken = SourceStore([BrokenBackend(60, 10, 10**6)])
+    with pytest.raises(ConnectionError):
+        await broken.set("https://a.com", "<p>a</p>")
+    assert not await broken.exists("https://a.com")
+
+
+async def test_disk_tier_shares_objects_and_expires(tmp_path):
+    disk = FileSystemSourceBackend(60, tmp_path)
+    await disk.set("https://a.com", b"same")
+    await disk.set("https://b.com", b"same")
+    await disk.set("https://c.com", b"other", ttl=1)
+
+    assert await disk.get("https://a.com") == b"same"
+    assert await disk.get_many(["https://b.com", "https://d.com"]) == [b"same", None]
+    assert len(list((tmp_path / "objects").glob("*/*"))) == 2
+    assert 0 < await disk.ttl("https://a.com") <= 60
+
+    # an expired index reads as missing
+    expired = time.time() - 1
+    os.utime(disk._index_path("https://c.com"), (expired, expired))
+    assert await disk.get("https://c.com") is None
+    assert not await disk.touch("https://c.com")
+    assert await disk.touch("https://a.com", ttl=120)
+    assert await disk.ttl("https://a.com") > 60
+
+
+async def test_disk_tier_prune(tmp_path):
+    disk = FileSystemSourceBackend(60, tmp_path)
+    await disk.set("https://a.com", b"kept")
+    await disk.set("https://b.com", b"expired")
+    await disk.set("https://c.com", b"deleted")
+    expired = time.time() - 1
+    os.utime(disk._index_path("https://b.com"), (expired, expired))
+    await disk.delete("https://c.com")
+
+    assert disk.prune() == 2
+    assert await disk.get("https://a.com") == b"kept"
+    assert len(list((tmp_path / "objects").glob("*/*"))) == 1
+
+
+@pytest.mark.parametrize(
+    "compression, header",
+    [("gzip", GZIP_HEADER), ("none", b"<htm")],
+)
+def test_compression_round_trip(compression, header):
+    value = compress_source(SOURCE, compression)
+    assert value[:4] == header
+    assert decompress_source(value) == SOURCE
+
+
+def test_zstd_round_trip():
+    pytest.importorskip("zstandard")
+    value = compress_source(SOURCE, "zstd")
+    assert value.startswith(ZSTD_HEADER)
+    assert decompress_source(value) == SOURCE
+
+
+def test_zstd_falls_back_to_gzip(monkeypatch):
+    monkeypatch.setattr(storage, "zstandard", None)
+    value = compress_source(SOURCE, "zstd")
+    assert value.startswith(GZIP_HEADER)
+    assert decompress_source(value) == SOURCE
+
+
+def test_legacy_values_are_read_as_text():
+    assert decompress_source(SOURCE.encode("utf-8")) == SOURCE
+
+
+async def test_redis_tier_reads_legacy_sources(redis, monkeypatch):
+    monkeypatch.setattr(Settings, "source_compression", "gzip")
+    backend = RedisSourceBackend(60, redis)
+    store = SourceStore([backend])
+    # stored as plain text before sources were compressed
+    await redis.set(backend.key("https://a.com"), SOURCE)
+    await store.set("https://b.com", SOURCE)
+
+    assert (await redis.get(backend.key("https://b.com")))[:4] == GZIP_HEADER
+    assert await store.get_many(["https://a.com", "https://b.com"]) == [
+        SOURCE,
+        SOURCE,
+    ]
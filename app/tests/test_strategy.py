@@ -0,0 +1,23 @@
+from apps.webpages.strategy import MethodStats, choose_method
+
+
+def test_choose_method_without_history():
+    assert choose_method({}) == "direct"
+
+
+def test_choose_method_skips_failing_tiers():
+    stats = {
+        "direct": MethodStats(attempts=10, successes=1, latency=5.0),
+        "browser": MethodStats(attempts=9, successes=9, latency=40.0),
+    }
+    assert choose_method(stats) == "embedded"
+
+    stats["embedded"] = MethodStats(attempts=9, successes=0, latency=1.0)
+    assert choose_method(stats) == "browser"
+
+
+def test_choose_method_keeps_working_direct():
+    stats = {"direct": MethodStats(attempts=10, successes=8, latency=5.0)}
+    assert choose_method(stats) == "direct"
+    assert stats["direct"].success_rate == 0.8
+    assert stats["direct"].average_latency == 0.5
@@ -0,0 +1,17 @@
+import pytest
+from utils.urltools import canonicalize_url
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("HTTPS://WWW.Example.com:443/Path?b=2&a=1#top", "www.example.com/Path?a=1&b=2"),
+        ("example.com", "example.com/"),
+        ("http://example.com:80", "example.com/"),
+        ("http://example.com:443", "example.com:443/"),
+        ("http://example.com:8080/a", "example.com:8080/a"),
+        ("https://example.com/?q=&a=1", "example.com/?a=1&q="),
+    ],
+)
+def test_canonicalize_url(url: str, expected: str):
+    assert canonicalize_url(url) == expected
@@ -0,0 +1,147 @@
+import pytest_asyncio
+from apps.webpages import storage
+from apps.webpages.models import Webpage
+from apps.webpages.routes import WebpageRouter
+from apps.webpages.schemas import WebpageCreateSchema
+from server.queue import BULK, INTERACTIVE, ReliableQueue
+
+
+USER_ID = "00000000-0000-0000-0000-00000000000a"
+
+
+@pytest_asyncio.fixture
+async def router(monkeypatch, redis):
+    store = storage.SourceStore([storage.MemorySourceBackend(60, 10, 10**6)])
+    monkeypatch.setattr(storage, "source_store", store)
+    router = WebpageRouter()
+
+    async def get_user_id(request):
+        return USER_ID
+
+    monkeypatch.setattr(router, "get_user_id", get_user_id)
+    await Webpage.get_motor_collection().delete_many({})
+    yield router
+    await Webpage.get_motor_collection().delete_many({})
+
+
+async def test_migrate_url_keys_merges_schemes():
+    collection = Webpage.get_motor_collection()
+    await collection.delete_many({})
+    await collection.insert_many(
+        [
+            {"uid": "1", "url": "https://a.com/x", "url_key": "https://a.com/x"},
+            {"uid": "2", "url": "http://a.com/x"},
+            {"uid": "3", "url": "https://b.com", "url_key": "https://b.com/"},
+        ]
+    )
+    # loading a document without url_key does not claim a key when saved
+    legacy = await Webpage.find_one(Webpage.uid == "2")
+    assert legacy.url_key is None
+    assert legacy.canonical_key == "a.com/x"
+    await legacy.save()
+
+    await Webpage.migrate_url_keys()
+    keys = {doc["uid"]: doc["url_key"] async for doc in collection.find({})}
+    assert keys == {"1": "a.com/x", "2": "a.com/x#2", "3": "b.com/"}
+    assert (await Webpage.get_by_url("http://a.com/x")).uid == "1"
+    await collection.delete_many({})
+
+
+
+async def test_load_soup_uses_engine_parser(monkeypatch):
+    from apps.webpages import extraction
+
+    monkeypatch.setattr(extraction.extraction_engine, "workers", 0)
+    webpage = Webpage(uid="1", url="https://a.com")
+    webpage._cache_page_source("<p>a</p>")
+    document = await webpage.parse(image_options={"max_side": 0})
+    assert document.soup is None
+    assert webpage.soup is None
+
+    soup = await webpage.load_soup()
+    assert soup.get_text() == "a"
+    assert webpage.soup is soup
+    # the engine's fields are kept
+    assert webpage.document.image_candidates == document.image_candidates
+    assert webpage.document.normalized_hash == document.normalized_hash
+
+async def test_create_batch_dedups_and_queues(router):
+    [cached] = await Webpage.get_or_create_many([WebpageCreateSchema(url="c.com")])
+    cached.task_status = "completed"
+    await cached.save()
+    await storage.source_store.set(cached.url, "<p>c</p>")
+
+    items = [
+        WebpageCreateSchema(url="a.com"),
+        WebpageCreateSchema(url="http://A.com/", force_refetch=True),
+        WebpageCreateSchema(url="https://c.com"),
+        WebpageCreateSchema(url="https://b.com", meta_data={"priority": BULK}),
+    ]
+    results = await router.create_batch(None, items)
+    assert results[0].uid == results[1].uid
+    assert results[2].uid == cached.uid
+    assert await Webpage.find().count() == 3
+    assert [result.task_status for result in results] == [
+        "init",
+        "init",
+        "completed",
+        "init",
+    ]
+    assert all(result.queued for result in results)
+
+    queue = Webpage.queue()
+    interactive = ReliableQueue.lane(INTERACTIVE, USER_ID)
+    assert await queue.lane_length(interactive) == 2
+    assert await queue.lane_length(ReliableQueue.lane(BULK, USER_ID)) == 1
+
+    # already queued urls are reported, not queued twice
+    results = await router.create_batch(None, items[:1])
+    assert not results[0].queued
+    assert await queue.lane_length(interactive) == 2
+
+
+async def test_queue_lanes_overflow_to_bulk(redis, monkeypatch):
+    from server.config import Settings
+
+    monkeypatch.setattr(Settings, "queue_interactive_backlog", 2)
+    await Webpage.queue().push({"uid": "1"}, lane=ReliableQueue.lane(INTERACTIVE, "t"))
+    lanes = await Webpage.queue_lanes([None, {}, None], "t")
+    assert lanes == ["interactive:t", "bulk:t", "bulk:t"]
+
+
+async def test_get_or_create_many_recovers_concurrent_inserts(router, monkeypatch):
+    items = [WebpageCreateSchema(url="https://a.com"), WebpageCreateSchema(url="b.com")]
+    insert_many = Webpage.insert_many
+
+    async def racing_insert_many(documents, **kwargs):
+        # another request stores a.com between the lookup and the insert
+        await insert_many(
+            [Webpage(uid="other", url="https://a.com", url_key="a.com/")]
+        )
+        return await insert_many(documents, **kwargs)
+
+    monkeypatch.setattr(Webpage, "insert_many", racing_insert_many)
+    webpages = await Webpage.get_or_create_many(items)
+    assert webpages[0].uid == "other"
+    assert webpages[1].url == "https://b.com"
+    assert await Webpage.find().count() == 2
+
+
+async def test_parse_reranks_candidates_for_other_options(monkeypatch):
+    from apps.webpages import extraction
+
+    monkeypatch.setattr(extraction.extraction_engine, "workers", 0)
+    webpage = Webpage(uid="1", url="https://a.com")
+    webpage._cache_page_source(
+        '<img src="/a.svg" width="800" height="800">'
+        '<img src="/b.png" width="800" height="800">'
+    )
+    options = {"min_side": 600, "max_side": 2500, "limit": 30, "with_svg": False}
+    document = await webpage.parse(image_options=options)
+    assert document.image_candidates == ["https://a.com/b.png"]
+    assert await webpage.parse(image_options=dict(options)) is document
+
+    document = await webpage.parse(image_options=options | {"with_svg": True})
+    assert document.image_candidates == ["https://a.com/a.svg", "https://a.com/b.png"]
+    document = await webpage.parse(image_options=options | {"limit": 1})
+    assert document.image_candidates == ["https://a.com/b.png"]
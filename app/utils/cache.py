@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+class LRUCache:
+    """Bounded in-process LRU cache with optional per-entry TTL.
+
+    Entries are bounded by count and, when `sizeof` is given, by total size.
+    """
+
+    def __init__(
+        self,
+        max_items: int = 1024,
+        *,
+        max_size: int | None = None,
+        ttl: float | None = None,
+        sizeof: Callable[[Any], int] | None = None,
+    ):
+        self.max_items = max_items
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 0)
+        self.size = 0
+        self._data: OrderedDict[Any, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._pop(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        size = self.sizeof(value)
+        if self.max_size is not None and size > self.max_size:
+            self.pop(key)
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, expires_at)
+            self.size += size
+            while len(self._data) > self.max_items or (
+                self.max_size is not None and self.size > self.max_size
+            ):
+                self._pop(next(iter(self._data)))
+
+    def ttl_of(self, key) -> float | None:
+        """Remaining seconds to live, or None when the key is missing or never expires."""
+        with self._lock:
+            item = self._data.get(key)
+        if item is None or item[1] is None:
+            return None
+        return max(item[1] - time.monotonic(), 0)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        value, _ = self._data.pop(key)
+        self.size -= self.sizeof(value)
+        return value
@@ -0,0 +1,35 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a url into the key used to look up webpages.
+
+    The scheme and fragment are dropped so http and https urls share a key,
+    the host is lower-cased, the default port is dropped, an empty path
+    becomes `/` and query parameters are sorted.
+    """
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+
+    host = (parts.hostname or "").rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo = f"{userinfo}:{parts.password}"
+        host = f"{userinfo}@{host}"
+
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    key = f"{host}{parts.path or '/'}"
+    return f"{key}?{query}" if query else key